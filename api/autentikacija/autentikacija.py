@@ -1,11 +1,15 @@
 from datetime import datetime
-from fastapi import Depends, HTTPException, status
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
+from sqlalchemy import literal, select, union_all
 from sqlalchemy.orm import Session
-from models.models import ActiveSession, Admin, RestaurantAdmin, Deliverer, Customer
+from models.models import Admin, RestaurantAdmin, Deliverer, Customer
 from database.database import get_db
 from utils.hashing import verify_password
+from utils.cache import TTLCache
+from utils.session_store import session_store
 from schemas.schemas import Token
 from dotenv import load_dotenv
 import os
@@ -14,32 +18,90 @@ load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 10000))
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", 60))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+verified_tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
 
 def create_access_token(data: dict, db: Session):
-    to_encode = data.copy()
+    # iat keeps every login's token distinct, so a logged out token stays revoked.
+    to_encode = {**data, "iat": datetime.utcnow()}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    session_store.set(db, data["sub"], encoded_jwt)
 
-    existing_session = db.query(ActiveSession).filter(ActiveSession.username == data["sub"]).first()
-    
-    if existing_session:
-        db.delete(existing_session)
-        db.commit()
+    return encoded_jwt
 
-    new_session = ActiveSession(username=data['sub'], token=encoded_jwt, created_at=datetime.utcnow())
-    db.add(new_session)
-    db.commit()
+def revoke_access_token(db: Session, username: str, token: str):
+    session_store.remove(db, username)
+    verified_tokens.invalidate(token)
 
-    return encoded_jwt
+def verify_access_token(token: str, db: Session):
+    payload = verified_tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        if payload.get("sub") is None:
+            return None
+    if not session_store.is_active(db, payload["sub"], token):
+        return None
+    verified_tokens.set(token, payload)
+    return payload
+
+# Checked in this order, as the separate per-table lookups used to be.
+USER_MODELS = [Admin, RestaurantAdmin, Deliverer, Customer]
+
+class UserIdentity(NamedTuple):
+    table: str
+    id: int
+    username: str
+    password: str
+    role: str
+
+identity_cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL_SECONDS)
 
 def get_user_by_username(db: Session, username: str):
-    user = db.query(Admin).filter(Admin.username == username).first() or \
-           db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first() or \
-           db.query(Deliverer).filter(Deliverer.username == username).first() or \
-           db.query(Customer).filter(Customer.username == username).first()
+    user = identity_cache.get(username)
+    if user is not None:
+        return user
+
+    # One UNION ALL round trip instead of probing the four user tables in turn.
+    lookup = union_all(*[
+        select(
+            literal(priority).label("priority"),
+            literal(model.__tablename__).label("table"),
+            model.id, model.username, model.password, model.role,
+        ).where(model.username == username)
+        for priority, model in enumerate(USER_MODELS)
+    ]).subquery()
+    row = db.execute(
+        select(lookup.c.table, lookup.c.id, lookup.c.username, lookup.c.password, lookup.c.role)
+        .order_by(lookup.c.priority)
+        .limit(1)
+    ).first()
+    if row is None:
+        # Misses are not cached so a freshly created account is visible at once.
+        return None
+
+    user = UserIdentity(*row)
+    identity_cache.set(username, user)
     return user
 
+def invalidate_user(username: str):
+    identity_cache.invalidate(username)
+
+def update_password_hash(db: Session, user: UserIdentity, hashed_password: str):
+    model = next(model for model in USER_MODELS if model.__tablename__ == user.table)
+    db.query(model).filter(model.id == user.id).update({"password": hashed_password})
+    db.commit()
+    invalidate_user(user.username)
+
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user or not verify_password(password, user.password):
@@ -52,18 +114,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    payload = verify_access_token(token, db)
+    if payload is None:
         raise credentials_exception
-    user = get_user_by_username(db, username)
+    if "role" in payload:
+        return {"username": payload["sub"], "role": payload["role"]}
+
+    # Tokens issued before the role claim existed.
+    user = get_user_by_username(db, payload["sub"])
     if user is None:
         raise credentials_exception
     return {"username": user.username, "role": user.role}
 
+async def get_stream_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    # EventSource cannot send headers, so streams also take ?access_token=.
+    return await get_current_user(token or access_token or "", db)
+
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm, db: Session = Depends(get_db)) -> Token:
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -72,8 +142,8 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm, db: Sessi
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    role = user.__class__.__name__
-    access_token = create_access_token(data={"sub": user.username, "role": role})
+    role = user.role
+    access_token = create_access_token(data={"sub": user.username, "role": role}, db=db)
     return Token(access_token=access_token, token_type="bearer")
 
 
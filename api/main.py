@@ -1,29 +1,50 @@
+import asyncio
 import base64
+import csv
+import json
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import math
 import smtplib
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from io import BytesIO
-from fastapi import FastAPI, Depends, HTTPException, Query, status
+from io import BytesIO, StringIO
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from sqlalchemy import desc, func
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy import desc, func, insert, select
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import date, datetime, timedelta
 from jose import JWTError, jwt
 from typing import Optional
-from utils.hashing import verify_password, get_password_hash
+from utils.hashing import get_password_hash, needs_rehash, password_hasher
+from utils.popularity import backfill_popularity, get_order_counts, increment_order_counts, is_popular
+from utils.image_store import guess_media_type, image_path, image_url, is_valid_hash, save_image
+from utils.geo import restaurant_index
+from utils.menu_cache import menu_cache
+from utils.etags import change_versions, etag_matches, make_etag
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, page_size
+from utils.search import search_index
+from utils.email_outbox import EMAIL_OUTBOX_POLL_SECONDS, drain_outbox, enqueue_email
+from utils.idempotency import idempotent
+from utils.order_state import MAX_BULK_OPERATIONS, transition_order, transition_orders
+from utils.order_projection import project_orders
+from utils.pubsub import pubsub
+from utils.locations import LOCATION_PERSIST_INTERVAL_SECONDS, latest_locations, location_topic, location_tracker, purge_old_locations
+from utils.dispatch import DISPATCH_ENABLED, DISPATCH_INTERVAL_SECONDS, run_dispatch
+from utils.routing import plan_route, route_cache
+from utils.availability import add_deliverer, backfill_availability, find_free_deliverers, set_offline_by_username, set_online
+from utils.notifications import backfill_unread_counters, get_unread_count, increment_unread, mark_read, purge_read_notifications
+from utils.session_store import SESSION_SWEEP_INTERVAL_SECONDS, session_store
 from models import models
-from models.models import ActiveSession, Admin, Customer, Deliverer, FoodItem, FoodType, Menu, Notification, Order, OrderFoodItem, Rating, Restaurant, RestaurantAdmin, RestaurantType
-from autentikacija.autentikacija import ALGORITHM, SECRET_KEY, create_access_token, get_current_user, get_user_by_username, oauth2_scheme
-from schemas.schemas import AdminCreate, ApplyDeliverer, ApplyPartner, ApproveOrderRequest, AssignOrderRequest, DelivererCreate, DelivererResponse, FoodItemCreate, FoodItemUpdate, FoodTypeCreate, OrderCreate, OrderResponse, RatingCreate, RequestPasswordResetSchema, ResetPasswordSchema, RestaurantAdminCreate, RestaurantCreate, RestaurantTypeCreate, RestaurantUpdate, StatusUpdate, CustomerCreate, TokenData
-from database.database import get_db, engine
-from sqlalchemy.orm import joinedload
+from models.models import Admin, Customer, Deliverer, DelivererAvailability, FoodItem, FoodItemPopularity, FoodType, Menu, Notification, NotificationCounter, Order, OrderFoodItem, Rating, Restaurant, RestaurantAdmin, RestaurantType
+from autentikacija.autentikacija import ALGORITHM, SECRET_KEY, create_access_token, get_current_user, get_stream_user, get_user_by_username, invalidate_user, oauth2_scheme, revoke_access_token, update_password_hash, verify_access_token
+from schemas.schemas import AdminCreate, ApplyDeliverer, ApplyPartner, ApproveOrderRequest, AssignOrderRequest, BulkAssignRequest, BulkStatusUpdate, DelivererCreate, DelivererResponse, FoodItemCreate, FoodItemUpdate, FoodTypeCreate, LocationPing, OrderCreate, OrderResponse, RatingCreate, RequestPasswordResetSchema, ResetPasswordSchema, RestaurantAdminCreate, RestaurantCreate, RestaurantTypeCreate, RestaurantUpdate, StatusUpdate, CustomerCreate, TokenData
+from database.database import SessionLocal, get_db, engine
+from sqlalchemy.orm import aliased, joinedload
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 import os
@@ -31,6 +52,20 @@ import os
 load_dotenv()
 
 models.Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, so add indexes introduced later.
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+with SessionLocal() as db:
+    # First start with the availability index: build it from orders and sessions.
+    if db.query(DelivererAvailability).first() is None and db.query(Deliverer.id).first() is not None:
+        backfill_availability(db)
+    # Likewise for counters that writes only ever adjust incrementally.
+    if db.query(FoodItemPopularity).first() is None and db.query(OrderFoodItem.order_id).first() is not None:
+        backfill_popularity(db)
+    if db.query(NotificationCounter).first() is None and db.query(Notification.id).filter(Notification.is_read == False).first() is not None:
+        backfill_unread_counters(db)
 
 def start_application():
     app = FastAPI()
@@ -53,37 +88,151 @@ SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = os.getenv("SMTP_PORT")
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+APPLICATIONS_EMAIL = "foodie.restaurants@outlook.com"
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = 15
+NOTIFICATION_STREAM_RETRY_MS = 3000
+# With several workers, set this so streams also pick up notifications
+# published by other processes; 0 relies on in-process events only.
+NOTIFICATION_STREAM_RESYNC_SECONDS = float(os.getenv("NOTIFICATION_STREAM_RESYNC_SECONDS", 0))
+LOCATION_STREAM_RESYNC_SECONDS = float(os.getenv("LOCATION_STREAM_RESYNC_SECONDS", 30))
 
 def is_username_taken(db: Session, username: str) -> bool:
-    return db.query(Admin).filter(Admin.username == username).first() or \
-           db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first() or \
-           db.query(Deliverer).filter(Deliverer.username == username).first() or \
-           db.query(Customer).filter(Customer.username == username).first()
+    return get_user_by_username(db, username) is not None
+
+def store_base64_image(image: str) -> str:
+    try:
+        image_data = base64.b64decode(image)
+    except base64.binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+    return save_image(image_data)
+
+def serialize_food_item(item: FoodItem) -> dict:
+    return {
+        "id": item.id,
+        "name": item.name,
+        "description": item.description,
+        "price": item.price,
+        "image_url": image_url(item.image_hash),
+        "discount_start": item.discount_start,
+        "discount_end": item.discount_end,
+        "discount_price": item.discount_price,
+        "type_id": item.type_id,
+        "restaurant_id": item.restaurant_id,
+        "is_active": item.is_active,
+    }
+
+def serialize_menu_items(db: Session, food_items: list) -> list:
+    # Popularity and food type names are fetched once for the whole list.
+    order_counts = get_order_counts(db, [item.id for item in food_items])
+    type_ids = {item.type_id for item in food_items}
+    food_types = dict(db.query(FoodType.id, FoodType.name).filter(FoodType.id.in_(type_ids)).all()) if type_ids else {}
+
+    return [
+        {
+            "id": item.id,
+            "name": item.name,
+            "description": item.description,
+            "price": item.price,
+            "image_url": image_url(item.image_hash),
+            "discount_price": item.discount_price,
+            "discount_start": item.discount_start,
+            "discount_end": item.discount_end,
+            "type": food_types.get(item.type_id),
+            "star": is_popular(order_counts.get(item.id, 0)),
+            "restaurant_id_food_item": item.restaurant_id
+        }
+        for item in food_items
+    ]
+
+def load_menus(db: Session, restaurant_ids: list) -> dict:
+    versions = {restaurant_id: menu_cache.version(restaurant_id) for restaurant_id in restaurant_ids}
+    menus = {}
+    missing = []
+    for restaurant_id in restaurant_ids:
+        menu = menu_cache.get(restaurant_id, versions[restaurant_id])
+        if menu is None:
+            missing.append(restaurant_id)
+        else:
+            menus[restaurant_id] = menu
+
+    if not missing:
+        return menus
+
+    restaurants = db.query(Restaurant.id, Restaurant.name).filter(Restaurant.id.in_(missing)).all()
+    food_items = db.query(FoodItem).filter(
+        FoodItem.restaurant_id.in_(missing),
+        FoodItem.is_active == True
+    ).order_by(FoodItem.id).all()
+
+    items_by_restaurant = {}
+    for item_data in serialize_menu_items(db, food_items):
+        items_by_restaurant.setdefault(item_data["restaurant_id_food_item"], []).append(item_data)
+
+    for restaurant_id, restaurant_name in restaurants:
+        menu = {"restaurant_name": restaurant_name, "food_items": items_by_restaurant.get(restaurant_id, [])}
+        menu_cache.put(restaurant_id, versions[restaurant_id], menu)
+        menus[restaurant_id] = menu
+    return menus
+
+def conditional_get(if_none_match: Optional[str], etag: str, response: Response) -> Optional[Response]:
+    # Returns the 304 to send, or tags the response that is about to be built.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+@app.get("/search")
+def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    result_type: Optional[str] = Query(None, alias="type", pattern="^(food_item|restaurant)$"),
+    db: Session = Depends(get_db),
+):
+    return {"query": q, "results": search_index.search(db, q, limit=limit, doc_type=result_type)}
+
+@app.get("/menu-cache/stats")
+def get_menu_cache_stats():
+    return menu_cache.stats()
+
+@app.get("/images/{image_hash}")
+def get_image(image_hash: str, if_none_match: Optional[str] = Header(None)):
+    if not is_valid_hash(image_hash) or not os.path.exists(image_path(image_hash)):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{image_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    path = image_path(image_hash)
+    return FileResponse(path, media_type=guess_media_type(path), headers=headers)
+
+@app.get("/hashing/stats")
+def get_hashing_stats():
+    return password_hasher.stats()
 
 @app.post("/token")
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = get_user_by_username(db, username=form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not password_hasher.verify_blocking(form_data.password, user.password):
         raise HTTPException(
             status_code=400,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username}, db=db)
+    # BCRYPT_ROUNDS changed since this hash was made; the plain password is only available now.
+    if needs_rehash(user.password):
+        update_password_hash(db, user, password_hasher.hash_blocking(form_data.password))
+    if user.role == "deliverer":
+        set_online(db, user.id, True)
+        db.commit()
+    access_token = create_access_token(data={"sub": user.username, "role": user.role}, db=db)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/validate-token")
 async def validate_token(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
-    user = get_user_by_username(db, username)
-    if user is None:
+    if verify_access_token(token, db) is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
     return {"valid": True}
@@ -112,10 +261,10 @@ def logout(token_data: TokenData, db: Session = Depends(get_db)):
                 detail="Invalid token",
             )
 
-        session = db.query(ActiveSession).filter(ActiveSession.username == username).first()
-        if session:
-            db.delete(session)
+        if payload.get("role", "deliverer") == "deliverer":
+            set_offline_by_username(db, username)
             db.commit()
+        revoke_access_token(db, username, token)
         return {"message": "Successfully logged out"}
     
     except JWTError:
@@ -124,85 +273,69 @@ def logout(token_data: TokenData, db: Session = Depends(get_db)):
             detail="Invalid token",
         )
 
-@app.get("/restaurants/{restaurant_id}/food_items")
-def get_food_items_for_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
-    restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found")
-
-
-    food_items = db.query(FoodItem).filter(FoodItem.restaurant_id == restaurant_id, FoodItem.is_active == True).all()
-
-
-    food_items_data = []
-
-    for item in food_items:
-        order_count = db.query(func.sum(OrderFoodItem.quantity)).filter(OrderFoodItem.food_item_id == item.id).scalar() or 0
-        
-
-        is_popular = order_count > 10
+def sweep_expired_sessions():
+    db = SessionLocal()
+    try:
+        session_store.sweep(db)
+    finally:
+        db.close()
 
-        food_type = item.type.name
+scheduler = BackgroundScheduler()
+scheduler.add_job(sweep_expired_sessions, 'interval', seconds=SESSION_SWEEP_INTERVAL_SECONDS)
+scheduler.start()
 
-        food_items_data.append({
-            "id": item.id,
-            "name": item.name,
-            "description": item.description,
-            "price": item.price,
-            "image": base64.b64encode(item.image).decode('utf-8') if item.image else None,
-            "discount_price": item.discount_price,
-            "discount_start": item.discount_start,
-            "discount_end": item.discount_end,
-            "type": food_type,
-            "star": is_popular,
-            "restaurant_id_food_item": item.restaurant_id
-        })
+@app.get("/restaurants/{restaurant_id}/food_items")
+def get_food_items_for_restaurant(restaurant_id: int, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    not_modified = conditional_get(if_none_match, make_etag("menu", restaurant_id, menu_cache.version(restaurant_id)), response)
+    if not_modified:
+        return not_modified
 
-    return {"restaurant_name": restaurant.name, "food_items": food_items_data}
+    menus = load_menus(db, [restaurant_id])
+    if restaurant_id not in menus:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
 
-def send_email(subject: str, body: str, to_email: str):
-    msg = MIMEMultipart()
-    msg['From'] = SMTP_USER
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_USER, to_email, msg.as_string())
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+    return menus[restaurant_id]
 
 @app.post("/apply/deliverer")
-async def apply_deliverer(deliverer: ApplyDeliverer):
+async def apply_deliverer(deliverer: ApplyDeliverer, db: Session = Depends(get_db)):
     subject = "New Deliverer Application"
     body = f"New Deliverer Application:\n\nName: {deliverer.name}\nEmail: {deliverer.email}\nPhone: {deliverer.phone}"
-    success = send_email(subject, body, "foodie.restaurants@outlook.com")
-    return JSONResponse(content={"message": "Application submitted successfully!" if success else "Failed to send email."})
+    enqueue_email(db, APPLICATIONS_EMAIL, subject, body)
+    db.commit()
+    return JSONResponse(content={"message": "Application submitted successfully!"})
 
 @app.post("/apply/partner")
-async def apply_partner(partner: ApplyPartner):
+async def apply_partner(partner: ApplyPartner, db: Session = Depends(get_db)):
     subject = "New Partner Application"
     body = f"New Partner Application:\n\nRestaurant Name: {partner.name}\nEmail: {partner.email}\nPhone: {partner.phone}"
-    success = send_email(subject, body, "foodie.restaurants@outlook.com")
-    return JSONResponse(content={"message": "Application submitted successfully!" if success else "Failed to send email."})
+    enqueue_email(db, APPLICATIONS_EMAIL, subject, body)
+    db.commit()
+    return JSONResponse(content={"message": "Application submitted successfully!"})
+
+def drain_email_outbox():
+    db = SessionLocal()
+    try:
+        drain_outbox(db)
+    finally:
+        db.close()
+
+scheduler = BackgroundScheduler()
+scheduler.add_job(drain_email_outbox, 'interval', seconds=EMAIL_OUTBOX_POLL_SECONDS)
+scheduler.start()
 
 #--------------
 # Admin
 #--------------
 
 @app.post("/create_admin")
+@idempotent("create_admin")
 def create_admin(user: AdminCreate, db: Session = Depends(get_db)):
     if is_username_taken(db, user.username):
         raise HTTPException(
             status_code=400,
             detail="Username already taken",
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_hasher.hash_blocking(user.password)
     db_user = Admin(
         username=user.username,
         email=user.email,
@@ -211,6 +344,7 @@ def create_admin(user: AdminCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
 
@@ -230,6 +364,10 @@ def create_restaurant(restaurant: RestaurantCreate, db: Session = Depends(get_db
     db.add(db_restaurant)
     db.commit()
     db.refresh(db_restaurant)
+    restaurant_index.rebuild(db)
+    menu_cache.bump(db_restaurant.id)
+    search_index.index_restaurant(db_restaurant)
+    change_versions.bump("restaurants")
     return db_restaurant
 
 @app.get("/restaurants/active-restaurnats")
@@ -251,12 +389,26 @@ def update_restaurant(restaurant_id: int, restaurant: RestaurantUpdate, db: Sess
     
     db.commit()
     db.refresh(db_restaurant)
+    restaurant_index.rebuild(db)
+    menu_cache.bump(db_restaurant.id)
+    search_index.index_restaurant(db_restaurant)
+    change_versions.bump("restaurants")
     return db_restaurant
 
 
 @app.get("/restaurants")
-def get_all_restaurants(db: Session = Depends(get_db)):
-    return db.query(Restaurant).filter(Restaurant.is_active == True).all()
+def get_all_restaurants(response: Response, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    not_modified = conditional_get(if_none_match, make_etag("restaurants", change_versions.get("restaurants"), limit, cursor), response)
+    if not_modified:
+        return not_modified
+
+    query = db.query(Restaurant).filter(Restaurant.is_active == True)
+    size = page_size(limit, cursor)
+    if size is None:
+        return query.all()
+
+    restaurants, next_cursor = keyset_page(query, [Restaurant.id], size, cursor)
+    return {"items": restaurants, "next_cursor": next_cursor}
 
 @app.get("/restaurants/{restaurant_id}")
 def get_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
@@ -274,6 +426,10 @@ def restore_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
     db_restaurant.is_active = True
     db.commit()
     db.refresh(db_restaurant)
+    restaurant_index.rebuild(db)
+    menu_cache.bump(db_restaurant.id)
+    search_index.index_restaurant(db_restaurant)
+    change_versions.bump("restaurants")
     return db_restaurant
 
 @app.put("/restaurants/{restaurant_id}/archive")
@@ -285,6 +441,10 @@ def archive_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
     db_restaurant.is_active = False
     db.commit()
     db.refresh(db_restaurant)
+    restaurant_index.rebuild(db)
+    menu_cache.bump(db_restaurant.id)
+    search_index.index_restaurant(db_restaurant)
+    change_versions.bump("restaurants")
     return db_restaurant
 
 @app.get("/protected-food_items")
@@ -297,11 +457,7 @@ def get_food_items(db: Session = Depends(get_db), current_user: dict = Depends(g
     restaurant_id = restaurant_admin.restaurant_id
     food_items = db.query(FoodItem).filter(FoodItem.restaurant_id == restaurant_id).all()
 
-    for item in food_items:
-        if item.image:
-            item.image = base64.b64encode(item.image).decode('utf-8')
-
-    return jsonable_encoder(food_items)
+    return [serialize_food_item(item) for item in food_items]
 
 @app.get("/protected-restaurants")
 def get_restaurants(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -324,10 +480,15 @@ def create_food_type(food_type: FoodTypeCreate, db: Session = Depends(get_db)):
     db.add(new_food_type)
     db.commit()
     db.refresh(new_food_type)
+    change_versions.bump("food_types")
     return new_food_type
 
 @app.get("/food_types")
-def read_food_types(db: Session = Depends(get_db)):
+def read_food_types(response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    not_modified = conditional_get(if_none_match, make_etag("food_types", change_versions.get("food_types")), response)
+    if not_modified:
+        return not_modified
+
     return db.query(FoodType).all()
 
 @app.get("/food_types/{food_type_id}")
@@ -342,6 +503,9 @@ def update_food_type(food_type_id: int, food_type: FoodTypeCreate, db: Session =
     db_food_type.name = food_type.name
     db.commit()
     db.refresh(db_food_type)
+    menu_cache.bump_all()
+    search_index.index_food_type(db, db_food_type)
+    change_versions.bump("food_types")
     return db_food_type
 
 
@@ -358,10 +522,15 @@ def delete_food_type(food_type_id: int, db: Session = Depends(get_db)):
 
     db.delete(db_food_type)
     db.commit()
+    change_versions.bump("food_types")
     return {"detail": "Food type deleted successfully"}
 
 @app.get("/restaurant_types")
-def get_restaurant_types(db: Session = Depends(get_db)):
+def get_restaurant_types(response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    not_modified = conditional_get(if_none_match, make_etag("restaurant_types", change_versions.get("restaurant_types")), response)
+    if not_modified:
+        return not_modified
+
     return db.query(RestaurantType).all()
 
 @app.post("/restaurant_types")
@@ -370,6 +539,7 @@ def create_restaurant_type(restaurant_type: RestaurantTypeCreate, db: Session =
     db.add(new_restaurant_type)
     db.commit()
     db.refresh(new_restaurant_type)
+    change_versions.bump("restaurant_types")
     return new_restaurant_type
 
 @app.put("/restaurant_types/{restaurant_type_id}")
@@ -380,6 +550,7 @@ def update_restaurant_type(restaurant_type_id: int, restaurant_type: RestaurantT
     db_restaurant_type.name = restaurant_type.name
     db.commit()
     db.refresh(db_restaurant_type)
+    change_versions.bump("restaurant_types")
     return db_restaurant_type
 
 @app.delete("/restaurant_types/{restaurant_type_id}")
@@ -395,6 +566,7 @@ def delete_restaurant_type(restaurant_type_id: int, db: Session = Depends(get_db
 
     db.delete(db_restaurant_type)
     db.commit()
+    change_versions.bump("restaurant_types")
     return {"detail": "Restaurant type deleted successfully"}
 
 #--------------
@@ -402,13 +574,14 @@ def delete_restaurant_type(restaurant_type_id: int, db: Session = Depends(get_db
 #--------------
 
 @app.post("/create_restaurant_admin")
+@idempotent("create_restaurant_admin")
 def create_restaurant_admin(user: RestaurantAdminCreate, db: Session = Depends(get_db)):
     if is_username_taken(db, user.username):
         raise HTTPException(
             status_code=400,
             detail="Username already taken",
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_hasher.hash_blocking(user.password)
     db_user = RestaurantAdmin(
         username=user.username,
         email=user.email,
@@ -418,22 +591,18 @@ def create_restaurant_admin(user: RestaurantAdminCreate, db: Session = Depends(g
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
 @app.post("/food_items")
 def create_food_item(food_item: FoodItemCreate, db: Session = Depends(get_db)):
-    image_data = None
-    if food_item.image:
-        try:
-            image_data = base64.b64decode(food_item.image)
-        except base64.binascii.Error:
-            raise HTTPException(status_code=400, detail="Invalid base64 image data")
+    image_hash = store_base64_image(food_item.image) if food_item.image else None
 
     db_food_item = models.FoodItem(
         name=food_item.name,
         description=food_item.description,
         price=food_item.price,
-        image=image_data,
+        image_hash=image_hash,
         discount_start=food_item.discount_start,
         discount_end=food_item.discount_end,
         discount_price=food_item.discount_price,
@@ -444,6 +613,8 @@ def create_food_item(food_item: FoodItemCreate, db: Session = Depends(get_db)):
     db.add(db_food_item)
     db.commit()
     db.refresh(db_food_item)
+    menu_cache.bump(db_food_item.restaurant_id)
+    search_index.index_food_item(db_food_item, db_food_item.type.name)
 
     response_item = FoodItemCreate(
         id=db_food_item.id,
@@ -467,23 +638,20 @@ def update_food_item(food_item_id: int, food_item: FoodItemUpdate, db: Session =
         raise HTTPException(status_code=404, detail="Food item not found")
     
     update_data = food_item.dict(exclude_unset=True)
-    if "image" in update_data and update_data["image"]:
-        try:
-            update_data["image"] = base64.b64decode(update_data["image"])
-        except base64.binascii.Error:
-            raise HTTPException(status_code=400, detail="Invalid base64 image data")
+    if "image" in update_data:
+        image = update_data.pop("image")
+        update_data["image_hash"] = store_base64_image(image) if image else None
     
+    old_restaurant_id = db_food_item.restaurant_id
     for key, value in update_data.items():
         setattr(db_food_item, key, value)
     
     db.commit()
     db.refresh(db_food_item)
+    menu_cache.bump(old_restaurant_id, db_food_item.restaurant_id)
+    search_index.index_food_item(db_food_item, db_food_item.type.name)
     
-    response_data = db_food_item.__dict__.copy()
-    if db_food_item.image:
-        response_data["image"] = base64.b64encode(db_food_item.image).decode('utf-8')
-    
-    return response_data
+    return serialize_food_item(db_food_item)
 
 @app.put("/food_items/{food_item_id}/deactivate")
 def deactivate_food_item(food_item_id: int, db: Session = Depends(get_db)):
@@ -495,12 +663,10 @@ def deactivate_food_item(food_item_id: int, db: Session = Depends(get_db)):
 
     db.commit()
     db.refresh(db_food_item)
+    menu_cache.bump(db_food_item.restaurant_id)
+    search_index.index_food_item(db_food_item, db_food_item.type.name)
 
-    response_data = db_food_item.__dict__.copy()
-    if db_food_item.image:
-        response_data["image"] = base64.b64encode(db_food_item.image).decode('utf-8')
-
-    return response_data
+    return serialize_food_item(db_food_item)
 
 @app.put("/food_items/{food_item_id}/activate")
 def activate_food_item(food_item_id: int, db: Session = Depends(get_db)):
@@ -512,12 +678,10 @@ def activate_food_item(food_item_id: int, db: Session = Depends(get_db)):
 
     db.commit()
     db.refresh(db_food_item)
+    menu_cache.bump(db_food_item.restaurant_id)
+    search_index.index_food_item(db_food_item, db_food_item.type.name)
 
-    response_data = db_food_item.__dict__.copy()
-    if db_food_item.image:
-        response_data["image"] = base64.b64encode(db_food_item.image).decode('utf-8')
-
-    return response_data
+    return serialize_food_item(db_food_item)
 
 @app.delete("/food_items/{food_item_id}")
 def delete_food_item(food_item_id: int, db: Session = Depends(get_db)):
@@ -525,14 +689,23 @@ def delete_food_item(food_item_id: int, db: Session = Depends(get_db)):
     if not db_food_item:
         raise HTTPException(status_code=404, detail="Food item not found")
     
+    restaurant_id = db_food_item.restaurant_id
+    db.query(FoodItemPopularity).filter(FoodItemPopularity.food_item_id == food_item_id).delete()
     db.delete(db_food_item)
     db.commit()
+    menu_cache.bump(restaurant_id)
+    search_index.remove_food_item(food_item_id)
     return {"detail": "Food item deleted successfully"}
 
 
 @app.get("/food_items")
-def get_all_food_items(db: Session = Depends(get_db)):
-    return db.query(FoodItem).all()
+def get_all_food_items(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    size = page_size(limit, cursor)
+    if size is None:
+        return [serialize_food_item(item) for item in db.query(FoodItem).all()]
+
+    food_items, next_cursor = keyset_page(db.query(FoodItem), [FoodItem.id], size, cursor)
+    return {"items": [serialize_food_item(item) for item in food_items], "next_cursor": next_cursor}
 
 @app.get("/food_items/{id}")
 def get_food_item(id: int, db: Session = Depends(get_db)):
@@ -540,15 +713,16 @@ def get_food_item(id: int, db: Session = Depends(get_db)):
     if not food_item:
         raise HTTPException(status_code=404, detail="Food item not found")
 
-    if food_item.image and isinstance(food_item.image, bytes):
-        food_item.image = base64.b64encode(food_item.image).decode('utf-8')
-
-    return food_item
+    return serialize_food_item(food_item)
 
 
 @app.get("/food_items/by_restaurant/{restaurant_id}")
-def get_food_items_by_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
-    return db.query(FoodItem).filter(FoodItem.restaurant_id == restaurant_id).all()
+def get_food_items_by_restaurant(restaurant_id: int, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    not_modified = conditional_get(if_none_match, make_etag("food_items", restaurant_id, menu_cache.version(restaurant_id)), response)
+    if not_modified:
+        return not_modified
+
+    return [serialize_food_item(item) for item in db.query(FoodItem).filter(FoodItem.restaurant_id == restaurant_id).all()]
 
 @app.get("/food_items/by_food_type/{food_type_id}")
 def get_food_items_by_food_type(food_type_id: int, db: Session = Depends(get_db)):
@@ -560,12 +734,19 @@ def update_food_item(food_item_id: int, food_item: FoodItemCreate, db: Session =
     if not db_food_item:
         raise HTTPException(status_code=404, detail="Food item not found")
     
-    for key, value in food_item.dict().items():
+    update_data = food_item.dict()
+    image = update_data.pop("image")
+    update_data["image_hash"] = store_base64_image(image) if image else None
+
+    old_restaurant_id = db_food_item.restaurant_id
+    for key, value in update_data.items():
         setattr(db_food_item, key, value)
     
     db.commit()
     db.refresh(db_food_item)
-    return db_food_item
+    menu_cache.bump(old_restaurant_id, db_food_item.restaurant_id)
+    search_index.index_food_item(db_food_item, db_food_item.type.name)
+    return serialize_food_item(db_food_item)
 
 @app.delete("/food_items/{food_item_id}")
 def delete_food_item(food_item_id: int, db: Session = Depends(get_db)):
@@ -573,8 +754,12 @@ def delete_food_item(food_item_id: int, db: Session = Depends(get_db)):
     if not db_food_item:
         raise HTTPException(status_code=404, detail="Food item not found")
     
+    restaurant_id = db_food_item.restaurant_id
+    db.query(FoodItemPopularity).filter(FoodItemPopularity.food_item_id == food_item_id).delete()
     db.delete(db_food_item)
     db.commit()
+    menu_cache.bump(restaurant_id)
+    search_index.remove_food_item(food_item_id)
     return {"detail": "Food item deleted successfully"}
 
 
@@ -595,12 +780,10 @@ def get_active_food_items(username: str, db: Session = Depends(get_db)):
 
     food_type_items = {}
     for item in food_items:
-        if item.image:
-            item.image = base64.b64encode(item.image).decode('utf-8')
         food_type = item.type.name
         if food_type not in food_type_items:
             food_type_items[food_type] = []
-        food_type_items[food_type].append(item)
+        food_type_items[food_type].append(serialize_food_item(item))
 
     result = {
         "restaurant_name": restaurant.name,
@@ -627,8 +810,8 @@ def read_menus(db: Session = Depends(get_db)):
     return menus
 
 @app.get("/all_orders")
-def read_orders(db: Session = Depends(get_db)):
-    orders = (
+def read_orders(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    query = (
         db.query(Order)
         .options(
             joinedload(Order.customer),
@@ -636,10 +819,14 @@ def read_orders(db: Session = Depends(get_db)):
             joinedload(Order.deliverer),
             joinedload(Order.food_items).joinedload(OrderFoodItem.food_item),
         )
-        .all()
     )
+    size = page_size(limit, cursor)
+    if size is None:
+        orders = query.all()
+    else:
+        orders, next_cursor = keyset_page(query, [Order.created_at, Order.id], size, cursor, descending=True)
     
-    if not orders:
+    if not orders and not cursor:
         raise HTTPException(status_code=404, detail="Orders not found")
     
     result = []
@@ -658,16 +845,91 @@ def read_orders(db: Session = Depends(get_db)):
         }
         result.append(order_data)
     
-    return result
+    if size is None:
+        return result
+    return {"items": result, "next_cursor": next_cursor}
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_COLUMNS = ["id", "created_at", "customer", "restaurant", "deliverer", "total_price", "status", "delivery_time", "delivered_time", "payment_method", "food_items"]
+
+def iter_order_export_rows(start: Optional[date], end: Optional[date], restaurant_id: Optional[int], order_status: Optional[str]):
+    # Runs while the response is streaming, so it owns its session instead of using get_db.
+    # Plain columns are selected so no ORM objects pile up in the session.
+    db = SessionLocal()
+    try:
+        DelivererAlias = aliased(Deliverer)
+        stmt = (
+            select(
+                Order.id, Order.created_at, Customer.username, Restaurant.name, DelivererAlias.username,
+                Order.total_price, Order.status, Order.delivery_time, Order.delivered_time, Order.payment_method
+            )
+            .join(Customer, Order.customer_id == Customer.id)
+            .join(Restaurant, Order.restaurant_id == Restaurant.id)
+            .outerjoin(DelivererAlias, Order.deliverer_id == DelivererAlias.id)
+            .order_by(Order.created_at, Order.id)
+        )
+        if start:
+            stmt = stmt.where(Order.created_at >= datetime.combine(start, datetime.min.time()))
+        if end:
+            stmt = stmt.where(Order.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        if restaurant_id is not None:
+            stmt = stmt.where(Order.restaurant_id == restaurant_id)
+        if order_status:
+            stmt = stmt.where(Order.status == order_status)
+
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            order_ids = [row[0] for row in batch]
+            items_by_order = {}
+            for order_id, name, quantity in db.query(OrderFoodItem.order_id, FoodItem.name, OrderFoodItem.quantity).join(
+                FoodItem, OrderFoodItem.food_item_id == FoodItem.id
+            ).filter(OrderFoodItem.order_id.in_(order_ids)):
+                items_by_order.setdefault(order_id, []).append({"name": name, "quantity": quantity})
+
+            for row in batch:
+                order_data = dict(zip(EXPORT_COLUMNS, row))
+                order_data["deliverer"] = order_data["deliverer"] or "N/A"
+                order_data["food_items"] = items_by_order.get(order_data["id"], [])
+                yield order_data
+    finally:
+        db.close()
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps({key: export_value(value) for key, value in row.items()}) + "\n"
+
+def iter_csv(rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row["food_items"] = "; ".join(f"{item['name']} x{item['quantity']}" for item in row["food_items"])
+        writer.writerow([export_value(row[column]) for column in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+@app.get("/all_orders/export")
+def export_orders(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    restaurant_id: Optional[int] = None,
+    order_status: Optional[str] = Query(None, alias="status"),
+):
+    rows = iter_order_export_rows(start, end, restaurant_id, order_status)
+    if export_format == "csv":
+        return StreamingResponse(iter_csv(rows), media_type="text/csv", headers={"Content-Disposition": 'attachment; filename="orders.csv"'})
+    return StreamingResponse(iter_ndjson(rows), media_type="application/x-ndjson")
 
 @app.put("/restaurant_admin/orders/{order_id}/approve")
 def approve_order(order_id: int, request: ApproveOrderRequest, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    order.status = request.status
+    transition_order(db, order_id, request.status, request.version)
     db.commit()
-    db.refresh(order)
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
     deliverer_username = None
     if order.deliverer_id:
         deliverer = db.query(models.Deliverer).filter(models.Deliverer.id == order.deliverer_id).first()
@@ -677,29 +939,50 @@ def approve_order(order_id: int, request: ApproveOrderRequest, db: Session = Dep
         status=order.status, 
         total_price=order.total_price,
         deliverer_id=order.deliverer_id,
-        deliverer_username=deliverer_username
+        deliverer_username=deliverer_username,
+        version=order.version
     )
 
 @app.put("/restaurant_admin/orders/{order_id}/assign")
 def assign_order(order_id: int, request: AssignOrderRequest, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
     deliverer = db.query(models.Deliverer).filter(models.Deliverer.id == request.deliverer_id).first()
     if not deliverer:
         raise HTTPException(status_code=404, detail="Deliverer not found")
-    order.deliverer_id = request.deliverer_id
-    order.status = "assigned"
+    transition_order(db, order_id, "assigned", request.version, deliverer_id=request.deliverer_id)
     db.commit()
-    db.refresh(order)
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
     return OrderResponse(
         id=order.id, 
         status=order.status, 
         total_price=order.total_price,
         deliverer_id=order.deliverer_id,
-        deliverer_username=deliverer.username
+        deliverer_username=deliverer.username,
+        version=order.version
     )
 
+@app.put("/restaurant_admin/orders/assign/bulk")
+def bulk_assign_orders(request: BulkAssignRequest, db: Session = Depends(get_db)):
+    # Checked before unknown deliverers are filtered out, so the cap applies to the whole request.
+    if len(request.assignments) > MAX_BULK_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations per request")
+    deliverer_ids = {assignment.deliverer_id for assignment in request.assignments}
+    known_deliverers = {row.id for row in db.query(Deliverer.id).filter(Deliverer.id.in_(deliverer_ids))}
+
+    operations = [
+        (assignment.order_id, "assigned", assignment.version, {"deliverer_id": assignment.deliverer_id})
+        for assignment in request.assignments if assignment.deliverer_id in known_deliverers
+    ]
+    applied = iter(transition_orders(db, operations))
+    db.commit()
+
+    results = []
+    for assignment in request.assignments:
+        if assignment.deliverer_id in known_deliverers:
+            results.append(next(applied))
+        else:
+            results.append({"order_id": assignment.order_id, "status_code": 404, "detail": "Deliverer not found"})
+    return {"results": results}
+
 @app.get("/orders/{username}")
 def get_orders(username: str, db: Session = Depends(get_db)):
     restaurant_admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
@@ -711,33 +994,7 @@ def get_orders(username: str, db: Session = Depends(get_db)):
         (Order.status == "pending") | (Order.status == "approved")
     ).order_by(Order.delivery_time.desc()).all()
 
-    order_responses = []
-    for order in orders:
-        deliverer_username = None
-        if order.deliverer_id:
-            deliverer = db.query(Deliverer).filter(Deliverer.id == order.deliverer_id).first()
-            deliverer_username = deliverer.username
-
-        restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-        customer = db.query(Customer).filter(Customer.id == order.customer_id).first()
-
-        order_responses.append({
-            "id": order.id,
-            "status": order.status,
-            "total_price": order.total_price,
-            "deliverer_id": order.deliverer_id,
-            "deliverer_username": deliverer_username,
-            "delivery_time": order.delivery_time.strftime("%Y-%m-%d %H:%M:%S") if order.delivery_time else "No delivery time set",
-            "restaurant": {
-                "name": restaurant.name,
-            },
-            "customer": {
-                "name": f"{customer.first_name} {customer.last_name}",
-                "address": customer.address,
-                "email": customer.email
-            }
-        })
-    return order_responses
+    return project_orders(db, orders, "admin")
 
 
 @app.get("/deliverers/free/{username}")
@@ -746,18 +1003,10 @@ def get_free_deliverers(username: str, db: Session = Depends(get_db)):
     if not restaurant_admin:
         raise HTTPException(status_code=404, detail="Restaurant Admin not found")
 
-    free_deliverers = db.query(Deliverer).filter(
-        Deliverer.restaurant_id == restaurant_admin.restaurant_id
-    ).options(joinedload(Deliverer.orders)).all()
-
-    result = []
-    for deliverer in free_deliverers:
-        active_session = db.query(ActiveSession).filter(ActiveSession.username == deliverer.username).first()
-        if active_session:
-            if not deliverer.orders or all(order.status == 'delivered' for order in deliverer.orders):
-                result.append(DelivererResponse(id=deliverer.id, username=deliverer.username))
-
-    return result
+    return [
+        DelivererResponse(id=deliverer.id, username=deliverer.username)
+        for deliverer in find_free_deliverers(db, restaurant_admin.restaurant_id)
+    ]
 
 @app.put("/restaurant_admin/{restaurant_id}/update")
 def update_restaurant_by_admin(
@@ -776,6 +1025,10 @@ def update_restaurant_by_admin(
     db.add(db_restaurant)
     db.commit()
     db.refresh(db_restaurant)
+    restaurant_index.rebuild(db)
+    menu_cache.bump(db_restaurant.id)
+    search_index.index_restaurant(db_restaurant)
+    change_versions.bump("restaurants")
     
     return db_restaurant
 
@@ -795,13 +1048,14 @@ def get_restaurant_types(db: Session = Depends(get_db)):
 #--------------
 
 @app.post("/create_deliverer")
+@idempotent("create_deliverer")
 def create_deliverer(user: DelivererCreate, db: Session = Depends(get_db)):
     if is_username_taken(db, user.username):
         raise HTTPException(
             status_code=400,
             detail="Username already taken",
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_hasher.hash_blocking(user.password)
     db_user = Deliverer(
         username=user.username,
         email=user.email,
@@ -809,8 +1063,11 @@ def create_deliverer(user: DelivererCreate, db: Session = Depends(get_db)):
         restaurant_id=user.restaurant_id,
     )
     db.add(db_user)
+    db.flush()
+    add_deliverer(db, db_user.id)
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
 
@@ -820,48 +1077,63 @@ def get_today_orders(deliverer_id: int, db: Session = Depends(get_db)):
     orders = (
         db.query(Order)
         .filter(Order.deliverer_id == deliverer_id, Order.created_at >= today)
-        .options(
-            joinedload(Order.customer),
-            joinedload(Order.restaurant),
-            joinedload(Order.food_items).joinedload(OrderFoodItem.food_item),
-        )
         .order_by(desc(Order.delivered_time))
         .all()
     )
-    result = []
-    for order in orders:
-        food_items = []
-        for item in order.food_items:
-            item_total_price = item.quantity * item.food_item.price
-            food_items.append({
-                "name": item.food_item.name,
-                "quantity": item.quantity,
-                "price": item.food_item.price,
-                "total": item_total_price
-            })
+    return project_orders(db, orders, "deliverer")
+
+@app.get("/route/{deliverer_id}")
+def get_deliverer_route(deliverer_id: int, db: Session = Depends(get_db)):
+    # Visiting order for the deliverer's open orders, starting at the restaurant.
+    rows = (
+        db.query(Order, Customer.latitude, Customer.longitude)
+        .join(Customer, Customer.id == Order.customer_id)
+        .filter(Order.deliverer_id == deliverer_id, Order.status.in_(["assigned", "in_transit"]))
+        .order_by(Order.id)
+        .all()
+    )
+    # Any transition bumps an order's version, so a changed order set misses.
+    cache_key = (deliverer_id, tuple((order.id, order.version) for order, _, _ in rows))
+    cached = route_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-        order_data = {
-            "id": order.id,
-            "customer": {
-                "name": f"{order.customer.first_name} {order.customer.last_name}",
-                "username": order.customer.username,
-                "address": order.customer.address
-            },
-            "restaurant": {
-                "name": order.restaurant.name,
-                "street": order.restaurant.street,
-                "city": order.restaurant.city
-            },
-            "total_price": order.total_price,
-            "quantity": sum(item.quantity for item in order.food_items),
-            "status": order.status,
-            "payment_method": order.payment_method,
-            "delivery_time": order.delivery_time,
-            "delivered_time": order.delivered_time,
-            "food_items": food_items,
-        }
-        result.append(order_data)
-    return result
+    if not rows:
+        return {"start": None, "total_distance_km": 0.0, "orders": []}
+
+    restaurant_id = db.query(Deliverer.restaurant_id).filter(Deliverer.id == deliverer_id).scalar() or rows[0][0].restaurant_id
+    restaurant = db.query(Restaurant.latitude, Restaurant.longitude).filter(Restaurant.id == restaurant_id).first()
+    if not restaurant:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+
+    orders = [order for order, _, _ in rows]
+    visits = plan_route(
+        restaurant.latitude,
+        restaurant.longitude,
+        [(latitude, longitude, order.delivery_time) for order, latitude, longitude in rows],
+        # delivery_time is local wall-clock time (create_order defaults it to datetime.now()).
+        datetime.now(),
+    )
+    projected = project_orders(db, orders, "deliverer")
+
+    route = []
+    for sequence, (position, distance, arrival, late) in enumerate(visits, start=1):
+        route.append({
+            **projected[position],
+            "sequence": sequence,
+            "latitude": rows[position][1],
+            "longitude": rows[position][2],
+            "distance_km": round(distance, 3),
+            "estimated_arrival": arrival,
+            "late": late,
+        })
+    response = jsonable_encoder({
+        "start": {"latitude": restaurant.latitude, "longitude": restaurant.longitude},
+        "total_distance_km": round(sum(visit[1] for visit in visits), 3),
+        "orders": route,
+    })
+    route_cache.set(cache_key, response)
+    return response
 
 
 @app.get("/get-id-deliverer/{username}")
@@ -871,28 +1143,30 @@ def get_id(username: str, db: Session = Depends(get_db)):
 
 @app.put("/orders/{order_id}/status")
 def update_order_status(order_id: int, status_update: StatusUpdate, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order.status = status_update.status
-    if status_update.status == "delivered":
-        order.delivered_time = datetime.utcnow()
+    values = {"delivered_time": datetime.utcnow()} if status_update.status == "delivered" else {}
+    version = transition_order(db, order_id, status_update.status, status_update.version, **values)
     
     db.commit()
-    return {"message": "Order status updated successfully"}
+    return {"message": "Order status updated successfully", "version": version}
 
 @app.put("/orders/{order_id}/reset")
-def reset_order_status(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order.status = "assigned"
-    order.delivered_time = None
+def reset_order_status(order_id: int, version: Optional[int] = None, db: Session = Depends(get_db)):
+    version = transition_order(db, order_id, "assigned", version, delivered_time=None)
     
     db.commit()
-    return {"message": "Order status reset successfully"}
+    return {"message": "Order status reset successfully", "version": version}
+
+@app.put("/orders/status/bulk")
+def bulk_update_order_status(request: BulkStatusUpdate, db: Session = Depends(get_db)):
+    # Every order delivered in one batch shares the same delivered_time.
+    now = datetime.utcnow()
+    operations = [
+        (update.order_id, update.status, update.version, {"delivered_time": now} if update.status == "delivered" else {})
+        for update in request.updates
+    ]
+    results = transition_orders(db, operations)
+    db.commit()
+    return {"results": results}
 
 #--------------
 # Customer
@@ -900,13 +1174,14 @@ def reset_order_status(order_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/register/customer")
+@idempotent("register_customer")
 def register_customer(user: CustomerCreate, db: Session = Depends(get_db)):
     if is_username_taken(db, user.username):
         raise HTTPException(
             status_code=400,
             detail="Username already taken",
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_hasher.hash_blocking(user.password)
     db_user = Customer(
         username=user.username,
         email=user.email,
@@ -920,25 +1195,9 @@ def register_customer(user: CustomerCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371.0
-
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-
-    return distance
-
 @app.get("/restaurants-with-food-items/{username}")
 def get_restaurants_with_food_items(username: str, db: Session = Depends(get_db)):
 
@@ -946,95 +1205,32 @@ def get_restaurants_with_food_items(username: str, db: Session = Depends(get_db)
     if not user:
         raise HTTPException(status_code=404, detail="Korisnik nije pronađen")
 
-    user_latitude = user.latitude
-    user_longitude = user.longitude
-
-    restaurants = db.query(Restaurant).filter(Restaurant.is_active == True).all()
-    result = []
-    
-    for restaurant in restaurants:
-        distance = calculate_distance(user_latitude, user_longitude, restaurant.latitude, restaurant.longitude)
-        if distance <= restaurant.distance_limit:
-            food_items = db.query(FoodItem).filter(FoodItem.restaurant_id == restaurant.id, FoodItem.is_active == True).all()
-            restaurant_data = {
-                "restaurant_name": restaurant.name,
-                "restaurant_id": restaurant.id,
-                "food_items": []
-            }
-            
-            for item in food_items:
-
-                order_count = db.query(func.sum(OrderFoodItem.quantity)).filter(OrderFoodItem.food_item_id == item.id).scalar() or 0
-                
-                is_popular = order_count > 10
-
-                food_type = db.query(FoodType).filter(FoodType.id == item.type_id).first().name
-
-                restaurant_data["food_items"].append({
-                    "id": item.id,
-                    "name": item.name,
-                    "description": item.description,
-                    "price": item.price,
-                    "image": base64.b64encode(item.image).decode('utf-8') if item.image else None,
-                    "discount_price": item.discount_price,
-                    "discount_start": item.discount_start,
-                    "discount_end": item.discount_end,
-                    "type": food_type,
-                    "star": is_popular,
-                    "restaurant_id_food_item": item.restaurant_id
-                })
-            
-            result.append(restaurant_data)
-    
-    return result
+    restaurant_ids = restaurant_index.reachable_restaurant_ids(db, user.latitude, user.longitude)
+    menus = load_menus(db, restaurant_ids)
 
+    return [
+        {
+            "restaurant_name": menus[restaurant_id]["restaurant_name"],
+            "restaurant_id": restaurant_id,
+            "food_items": menus[restaurant_id]["food_items"]
+        }
+        for restaurant_id in restaurant_ids
+        if restaurant_id in menus
+    ]
 
-def send_order_confirmation_email(email: str, order_ids: list, db: Session):
 
-    orders = db.query(Order).filter(Order.id.in_(order_ids)).all()
-    
-    if not orders:
-        print("No orders found")
-        return
-    
-    email_subject = "Order Confirmation"
+def order_confirmation_body(lines: list, total_price: float, delivery_time) -> str:
     email_body = "Thank you for your order!\n\nHere are the details of your order:\n\n"
-    
-    for order in orders:
-        order_items = db.query(OrderFoodItem).filter(OrderFoodItem.order_id == order.id).all()
-        
-        for order_item in order_items:
-            food_item = db.query(FoodItem).filter(FoodItem.id == order_item.food_item_id).first()
-            if food_item:
-                item_name = food_item.name
-                item_price = food_item.price
-                total_item_price = item_price * order_item.quantity
-                email_body += f"Item: {item_name}\nQuantity: {order_item.quantity}\nPrice: ${total_item_price:.2f}\n\n"
-    
-    email_body += f"Total Price: ${sum(order.total_price for order in orders):.2f}\n\n"
-    email_body += f"Delivery Time: {orders[0].delivery_time if orders[0].delivery_time else 'Not specified'}\n\n"
+    for name, quantity, price in lines:
+        email_body += f"Item: {name}\nQuantity: {quantity}\nPrice: ${price * quantity:.2f}\n\n"
+    email_body += f"Total Price: ${total_price:.2f}\n\n"
+    email_body += f"Delivery Time: {delivery_time if delivery_time else 'Not specified'}\n\n"
     email_body += "We will notify you when your order is out for delivery.\n\nThank you for choosing us!"
-    
-    msg = MIMEMultipart()
-    msg['From'] = SMTP_USER
-    msg['To'] = email
-    msg['Subject'] = email_subject
-    msg.attach(MIMEText(email_body, 'plain'))
-    
-    try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        
-        server.sendmail(SMTP_USER, email, msg.as_string())
-        print("Email sent successfully")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-    finally:
-        server.quit()
+    return email_body
 
 
 @app.post("/customer/create-order/{username}")
+@idempotent("create_order")
 def create_order(username: str, order: OrderCreate, db: Session = Depends(get_db)):
     customer = db.query(Customer).filter(Customer.username == username).first()
     
@@ -1043,11 +1239,21 @@ def create_order(username: str, order: OrderCreate, db: Session = Depends(get_db
     
     delivery_time = datetime.now() if not order.delivery_time else datetime.fromisoformat(order.delivery_time)
     
+    # Duplicate cart lines are merged; order_fooditem is keyed by (order_id, food_item_id).
+    quantities = {}
+    for item in order.cart:
+        quantities[item.food_item_id] = quantities.get(item.food_item_id, 0) + item.quantity
+
+    prices = {
+        row.id: row
+        for row in db.query(FoodItem.id, FoodItem.name, FoodItem.price, FoodItem.restaurant_id).filter(FoodItem.id.in_(list(quantities)))
+    }
+
     total_price = 0
     restaurant_id = None
     
     for item in order.cart:
-        food_item = db.query(FoodItem).filter(FoodItem.id == item.food_item_id).first()
+        food_item = prices.get(item.food_item_id)
         if not food_item:
             raise HTTPException(status_code=404, detail=f"Food item with ID {item.food_item_id} not found")
         
@@ -1059,6 +1265,9 @@ def create_order(username: str, order: OrderCreate, db: Session = Depends(get_db
         elif restaurant_id != food_item.restaurant_id:
             raise HTTPException(status_code=400, detail="All items in the cart must be from the same restaurant")
 
+    # The order, its lines, the popularity counters, the notification and the
+    # confirmation email are committed together, so a failure part way leaves
+    # no partial order.
     order_instance = Order(
         customer_id=customer.id,
         restaurant_id=restaurant_id,
@@ -1067,113 +1276,200 @@ def create_order(username: str, order: OrderCreate, db: Session = Depends(get_db
         payment_method=order.payment_method
     )
     db.add(order_instance)
-    db.commit()
-    db.refresh(order_instance)
-    
-    for item in order.cart:
-        order_food_item = OrderFoodItem(
-            order_id=order_instance.id,
-            food_item_id=item.food_item_id,
-            quantity=item.quantity
-        )
-        db.add(order_food_item)
-    
-    db.commit()
-    
+    db.flush()
 
-    send_order_confirmation_email(customer.email, [order_instance.id], db)
+    if quantities:
+        db.execute(insert(OrderFoodItem), [
+            {"order_id": order_instance.id, "food_item_id": food_item_id, "quantity": quantity}
+            for food_item_id, quantity in quantities.items()
+        ])
+    became_popular = increment_order_counts(db, quantities)
 
-    new_notification = Notification(
+    notification = Notification(
         restaurant_id=restaurant_id,
         order_id=order_instance.id,
     )
-    db.add(new_notification)
+    db.add(notification)
+    increment_unread(db, restaurant_id)
+    lines = [(prices[food_item_id].name, quantity, prices[food_item_id].price) for food_item_id, quantity in quantities.items()]
+    enqueue_email(db, customer.email, "Order Confirmation", order_confirmation_body(lines, total_price, delivery_time))
+    db.flush()
+    # Read before commit expires the instances.
+    order_id = order_instance.id
+    notification_data = serialize_notification(notification)
     db.commit()
+    if became_popular:
+        menu_cache.bump(restaurant_id)
+    pubsub.publish(("notifications", restaurant_id), notification_data)
     
-    return {"detail": "Order placed successfully", "order_id": order_instance.id}
+    return {"detail": "Order placed successfully", "order_id": order_id}
 
 @app.get("/customer/orders/{username}")
-def get_orders_for_customer(username: str, db: Session = Depends(get_db)):
+def get_orders_for_customer(username: str, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
     customer = db.query(Customer).filter(Customer.username == username).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    orders = db.query(Order).filter(Order.customer_id == customer.id).order_by(Order.created_at.desc()).all()
+    query = db.query(Order).filter(Order.customer_id == customer.id)
+    size = page_size(limit, cursor)
+    if size is None:
+        orders = query.order_by(Order.created_at.desc()).all()
+    else:
+        orders, next_cursor = keyset_page(query, [Order.created_at, Order.id], size, cursor, descending=True)
     
-    orders_details = []
-    for order in orders:
-        restaurant = db.query(Restaurant).filter(Restaurant.id == order.restaurant_id).first()
-        order_food_items = db.query(OrderFoodItem).filter(OrderFoodItem.order_id == order.id).all()
-
-        food_items_details = []
-        for order_food_item in order_food_items:
-            food_item = db.query(FoodItem).filter(FoodItem.id == order_food_item.food_item_id).first()
-            food_items_details.append({
-                "name": food_item.name,
-                "quantity": order_food_item.quantity,
-                "price": food_item.price
-            })
-
-        order_details = {
-            "id": order.id,
-            "created_at": order.created_at,
-            "delivery_time": order.delivery_time,
-            "delivered_time": order.delivered_time,
-            "status": order.status,
-            "total_price": order.total_price,
-            "payment_method": order.payment_method,
-            "restaurant_name": restaurant.name if restaurant else "Unknown",
-            "food_items": food_items_details
-        }
-        orders_details.append(order_details)
+    orders_details = project_orders(db, orders, "customer")
 
-    return orders_details
+    if size is None:
+        return orders_details
+    return {"items": orders_details, "next_cursor": next_cursor}
 
 # Extra features
 
 @app.get("/notifications/{username}")
-async def get_notifications(username: str, db: Session = Depends(get_db)):
+async def get_notifications(username: str, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
     restaurant_admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
     if not restaurant_admin:
         raise HTTPException(status_code=404, detail="Restaurant admin not found")
     
-    notifications = db.query(Notification).filter(
-        Notification.restaurant_id == restaurant_admin.restaurant_id
-    ).order_by(Notification.created_at.desc()).all()
+    query = db.query(Notification).filter(Notification.restaurant_id == restaurant_admin.restaurant_id)
+    size = page_size(limit, cursor)
+    if size is None:
+        # Old clients get the newest page only; older ones are reachable with a cursor.
+        notifications = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(DEFAULT_PAGE_SIZE).all()
+    else:
+        notifications, next_cursor = keyset_page(query, [Notification.created_at, Notification.id], size, cursor, descending=True)
+
+    unread_count = get_unread_count(db, restaurant_admin.restaurant_id)
+
+    if size is None:
+        return {"notifications": notifications, "unread_count": unread_count}
+    return {"notifications": notifications, "unread_count": unread_count, "next_cursor": next_cursor}
+
+def serialize_notification(notification: Notification) -> dict:
+    return {
+        "id": notification.id,
+        "restaurant_id": notification.restaurant_id,
+        "order_id": notification.order_id,
+        "is_read": bool(notification.is_read),
+        "created_at": notification.created_at.isoformat(),
+    }
+
+def load_notifications_after(restaurant_id: int, after_id: int | None) -> tuple:
+    db = SessionLocal()
+    try:
+        if after_id is None:
+            # No resume point: only notifications created from now on.
+            return [], db.query(func.max(Notification.id)).filter(Notification.restaurant_id == restaurant_id).scalar() or 0
+        notifications = db.query(Notification).filter(
+            Notification.restaurant_id == restaurant_id,
+            Notification.id > after_id,
+        ).order_by(Notification.id).limit(MAX_PAGE_SIZE).all()
+        events = [serialize_notification(notification) for notification in notifications]
+        return events, events[-1]["id"] if events else after_id
+    finally:
+        db.close()
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
 
-    # Izbroji nepročitane notifikacije
-    unread_count = db.query(Notification).filter(
-        Notification.restaurant_id == restaurant_admin.restaurant_id,
-        Notification.is_read == False
-    ).count()
+@app.get("/notifications/{username}/stream")
+async def stream_notifications(username: str, request: Request, last_event_id: Optional[str] = Header(None), after: Optional[int] = None):
+    # Server-Sent Events. EventSource sends Last-Event-ID on reconnect, and the
+    # missed notifications are replayed from the table before live events.
+    db = SessionLocal()
+    try:
+        restaurant_admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
+        if not restaurant_admin:
+            raise HTTPException(status_code=404, detail="Restaurant admin not found")
+        restaurant_id = restaurant_admin.restaurant_id
+    finally:
+        db.close()
+    resume_from = int(last_event_id) if last_event_id and last_event_id.isdigit() else after
 
-    return {"notifications": notifications, "unread_count": unread_count}
+    async def events():
+        # Subscribe before the catch-up query so nothing published in between is lost.
+        subscription = pubsub.subscribe(("notifications", restaurant_id))
+        try:
+            yield f"retry: {NOTIFICATION_STREAM_RETRY_MS}\n\n"
+            last_id = resume_from
+            while True:
+                backlog, last_id = await run_in_threadpool(load_notifications_after, restaurant_id, last_id)
+                for event in backlog:
+                    yield format_sse(event)
+                if len(backlog) < MAX_PAGE_SIZE:
+                    break
+
+            while not subscription.overflowed and not await request.is_disconnected():
+                event = await subscription.get(NOTIFICATION_STREAM_RESYNC_SECONDS or NOTIFICATION_STREAM_HEARTBEAT_SECONDS)
+                if event is None:
+                    if NOTIFICATION_STREAM_RESYNC_SECONDS:
+                        # Picks up notifications published by other workers.
+                        backlog, last_id = await run_in_threadpool(load_notifications_after, restaurant_id, last_id)
+                        for event in backlog:
+                            yield format_sse(event)
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield format_sse(event)
+        finally:
+            pubsub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.put("/notifications/mark_as_read/{username}")
-async def mark_notifications_as_read(username: str, db: Session = Depends(get_db)):
+async def mark_notifications_as_read(username: str, up_to_id: Optional[int] = None, db: Session = Depends(get_db)):
     restaurant_admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
     if not restaurant_admin:
         raise HTTPException(status_code=404, detail="Restaurant admin not found")
     
-    db.query(Notification).filter(
-        Notification.restaurant_id == restaurant_admin.restaurant_id,
-        Notification.is_read == False
-    ).update({"is_read": True})
+    mark_read(db, restaurant_admin.restaurant_id, up_to_id)
 
     db.commit()
     return {"message": "Notifications marked as read"}
 
+def purge_old_notifications():
+    db = SessionLocal()
+    try:
+        purge_read_notifications(db)
+    finally:
+        db.close()
+
+scheduler = BackgroundScheduler()
+scheduler.add_job(purge_old_notifications, 'cron', hour=3, minute=30)
+scheduler.start()
+
+def dispatch_orders():
+    db = SessionLocal()
+    try:
+        run_dispatch(db)
+    finally:
+        db.close()
+
+if DISPATCH_ENABLED:
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(dispatch_orders, 'interval', seconds=DISPATCH_INTERVAL_SECONDS)
+    scheduler.start()
+
 
 
 @app.get("/deliverers/{username}")
-def get_deliverers_by_admin(username: str, db: Session = Depends(get_db)):
+def get_deliverers_by_admin(username: str, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
     try:
         admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
         if not admin:
             raise HTTPException(status_code=404, detail="Restaurant admin not found")
 
-        deliverers = db.query(Deliverer).filter(Deliverer.restaurant_id == admin.restaurant_id).all()
-        return deliverers
+        query = db.query(Deliverer).filter(Deliverer.restaurant_id == admin.restaurant_id)
+        size = page_size(limit, cursor)
+        if size is None:
+            return query.all()
+
+        deliverers, next_cursor = keyset_page(query, [Deliverer.id], size, cursor)
+        return {"items": deliverers, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching deliverers: {str(e)}")
 
@@ -1213,11 +1509,127 @@ def get_orders_by_date(
                 "total_price": order.total_price,
                 "customer_latitude": order.customer.latitude,
                 "customer_longitude": order.customer.longitude,
+                "deliverer_location": location_tracker.latest(order.deliverer_id) if order.deliverer_id else None,
             } for order in orders
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Deliverer locations
+
+def load_deliverer_username(deliverer_id: int):
+    db = SessionLocal()
+    try:
+        return location_tracker.load_username(db, deliverer_id)
+    finally:
+        db.close()
+
+@app.post("/deliverers/{deliverer_id}/location")
+async def record_deliverer_location(deliverer_id: int, ping: LocationPing, current_user: dict = Depends(get_current_user)):
+    # Called every few seconds by every deliverer, so it stays off the
+    # database: the token check is cached and only the first ping of a
+    # deliverer looks up its username.
+    username = location_tracker.username_of(deliverer_id) or await run_in_threadpool(load_deliverer_username, deliverer_id)
+    if username is None:
+        raise HTTPException(status_code=404, detail="Deliverer not found")
+    if current_user["role"] != "deliverer" or current_user["username"] != username:
+        raise HTTPException(status_code=403, detail="Not allowed to report this deliverer's location")
+    return location_tracker.record(deliverer_id, ping.latitude, ping.longitude)
+
+@app.get("/deliverers/{deliverer_id}/location")
+def get_deliverer_location(deliverer_id: int, db: Session = Depends(get_db)):
+    locations = latest_locations(db, {deliverer_id})
+    return {
+        "location": locations[0] if locations else None,
+        "trail": location_tracker.trail(deliverer_id),
+    }
+
+def load_deliverers_on_orders(restaurant_id: int | None = None, customer_id: int | None = None) -> tuple:
+    # Deliverers currently carrying the restaurant's or customer's orders,
+    # with their last known positions.
+    db = SessionLocal()
+    try:
+        query = db.query(Order.deliverer_id).filter(
+            Order.status.in_(["assigned", "in_transit"]),
+            Order.deliverer_id != None,
+        )
+        if restaurant_id is not None:
+            query = query.filter(Order.restaurant_id == restaurant_id)
+        if customer_id is not None:
+            query = query.filter(Order.customer_id == customer_id)
+        deliverer_ids = {row[0] for row in query.distinct()}
+        return deliverer_ids, latest_locations(db, deliverer_ids)
+    finally:
+        db.close()
+
+def format_location_sse(event: dict) -> str:
+    return f"event: location\ndata: {json.dumps(event)}\n\n"
+
+def stream_locations(request: Request, **owner) -> StreamingResponse:
+    async def events():
+        subscription = pubsub.subscribe()
+        try:
+            yield f"retry: {NOTIFICATION_STREAM_RETRY_MS}\n\n"
+            deliverer_ids = set()
+            while not subscription.overflowed and not await request.is_disconnected():
+                # Orders get assigned and delivered, so the set of deliverers
+                # to follow is refreshed every LOCATION_STREAM_RESYNC_SECONDS.
+                current_ids, locations = await run_in_threadpool(load_deliverers_on_orders, **owner)
+                pubsub.resubscribe(subscription, [location_topic(deliverer_id) for deliverer_id in current_ids])
+                for location in locations:
+                    if location["deliverer_id"] not in deliverer_ids:
+                        yield format_location_sse(location)
+                deliverer_ids = current_ids
+
+                resync_at = asyncio.get_running_loop().time() + LOCATION_STREAM_RESYNC_SECONDS
+                while not subscription.overflowed and not await request.is_disconnected():
+                    remaining = resync_at - asyncio.get_running_loop().time()
+                    if remaining <= 0:
+                        break
+                    event = await subscription.get(min(remaining, NOTIFICATION_STREAM_HEARTBEAT_SECONDS))
+                    yield format_location_sse(event) if event is not None else ": keep-alive\n\n"
+        finally:
+            pubsub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/map/deliverers/{username}/stream")
+def stream_restaurant_deliverer_locations(username: str, request: Request, current_user: dict = Depends(get_stream_user), db: Session = Depends(get_db)):
+    if current_user["role"] != "restaurantadmin" or current_user["username"] != username:
+        raise HTTPException(status_code=403, detail="Not allowed to follow these deliverers")
+    restaurant_admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
+    if not restaurant_admin:
+        raise HTTPException(status_code=404, detail="RestaurantAdmin not found")
+    return stream_locations(request, restaurant_id=restaurant_admin.restaurant_id)
+
+@app.get("/customer/orders/{username}/deliverer_locations/stream")
+def stream_customer_deliverer_locations(username: str, request: Request, current_user: dict = Depends(get_stream_user), db: Session = Depends(get_db)):
+    if current_user["role"] != "customer" or current_user["username"] != username:
+        raise HTTPException(status_code=403, detail="Not allowed to follow these deliverers")
+    customer = db.query(Customer).filter(Customer.username == username).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return stream_locations(request, customer_id=customer.id)
+
+def persist_locations():
+    db = SessionLocal()
+    try:
+        location_tracker.persist(db)
+    finally:
+        db.close()
+
+def purge_locations():
+    db = SessionLocal()
+    try:
+        purge_old_locations(db)
+    finally:
+        db.close()
+
+scheduler = BackgroundScheduler()
+scheduler.add_job(persist_locations, 'interval', seconds=LOCATION_PERSIST_INTERVAL_SECONDS)
+scheduler.add_job(purge_locations, 'cron', hour=3, minute=45)
+scheduler.start()
+
 # Restaurant Admins reports
 
 def generate_restaurant_report(restaurant_id: int, db: Session):
@@ -1395,24 +1807,8 @@ def generate_reset_token(username: str, email: str, role: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
 
-def send_reset_email(to_email: str, reset_token: str, username: str):
-    subject = "Password Reset Request"
-    body = f"Hi {username},\n\nYour password reset token is: {reset_token}\n\nIf you did not request a password reset, please ignore this email.\n\nBest regards,\nFoodie Restaurants Team"
-
-    msg = MIMEMultipart()
-    msg['From'] = SMTP_USER
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
-            print(f"Reset token email sent to {to_email}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+def reset_email_body(reset_token: str, username: str) -> str:
+    return f"Hi {username},\n\nYour password reset token is: {reset_token}\n\nIf you did not request a password reset, please ignore this email.\n\nBest regards,\nFoodie Restaurants Team"
 
 def find_user_by_role(db: Session, username: str, email: str, role: str):
     if role == "admin":
@@ -1432,7 +1828,8 @@ async def request_password_reset(data: RequestPasswordResetSchema, db: Session =
         raise HTTPException(status_code=404, detail="User with this username, email, and role not found")
 
     reset_token = generate_reset_token(data.username, data.email, data.role)
-    send_reset_email(data.email, reset_token, data.username)
+    enqueue_email(db, data.email, "Password Reset Request", reset_email_body(reset_token, data.username))
+    db.commit()
 
     return {"message": "Reset token sent to your email"}
 
@@ -1454,9 +1851,10 @@ async def reset_password(data: ResetPasswordSchema, db: Session = Depends(get_db
         if not user:
             raise HTTPException(status_code=404, detail=f"User not found with username: {data.username}, email: {data.email}, role: {data.role}")
 
-        hashed_password = get_password_hash(data.new_password)
+        hashed_password = await password_hasher.hash(data.new_password)
         user.password = hashed_password
         db.commit()
+        invalidate_user(user.username)
 
         return {"message": "Password reset successful"}
     except JWTError:
@@ -1488,6 +1886,7 @@ def get_rateable_order(username: str, db: Session = Depends(get_db)):
     return order
 
 @app.post("/orders/rating/{username}")
+@idempotent("rate_order")
 def rate_order(username: str, rating: RatingCreate, db: Session = Depends(get_db)):
     customer = db.query(Customer).filter_by(username=username).first()
     if not customer:
@@ -1525,24 +1924,27 @@ def rate_order(username: str, rating: RatingCreate, db: Session = Depends(get_db
     return new_rating
 
 @app.get("/ratings/{username}")
-def get_ratings_for_admin(username: str, db: Session = Depends(get_db)):
+def get_ratings_for_admin(username: str, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: Session = Depends(get_db)):
     admin = db.query(RestaurantAdmin).filter(RestaurantAdmin.username == username).first()
     
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
     
-    ratings = (db.query(Rating)
+    query = (db.query(Rating)
                   .join(Customer, Rating.customer_id == Customer.id)
                   .join(Restaurant, Rating.restaurant_id == Restaurant.id)
                   .join(Order, Rating.order_id == Order.id)
-                  .filter(Rating.restaurant_id == admin.restaurant_id)
-                  .order_by(Rating.created_at.desc())
-                  .all())
-    
-    if not ratings:
+                  .filter(Rating.restaurant_id == admin.restaurant_id))
+    size = page_size(limit, cursor)
+    if size is None:
+        ratings = query.order_by(Rating.created_at.desc()).all()
+    else:
+        ratings, next_cursor = keyset_page(query, [Rating.created_at, Rating.id], size, cursor, descending=True)
+    
+    if not ratings and not cursor:
         raise HTTPException(status_code=404, detail="No ratings found for this restaurant")
     
-    return [
+    result = [
         {
             "id": rating.id,
             "rating": rating.rating,
@@ -1561,4 +1963,8 @@ def get_ratings_for_admin(username: str, db: Session = Depends(get_db)):
             }
         }
         for rating in ratings
-    ]
\ No newline at end of file
+    ]
+
+    if size is None:
+        return result
+    return {"items": result, "next_cursor": next_cursor}
\ No newline at end of file
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, LargeBinary, String, Float, Boolean, ForeignKey, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Index, Integer, LargeBinary, String, Float, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -57,6 +57,10 @@ class Deliverer(Base):
     role = Column(String, default="deliverer")
     restaurant_id = Column(Integer, ForeignKey('restaurants.id'), nullable=True)
 
+    __table_args__ = (
+        Index('ix_deliverers_restaurant_id', 'restaurant_id'),
+    )
+
     restaurant = relationship("Restaurant", back_populates="deliverers")
     orders = relationship("Order", back_populates="deliverer")
 
@@ -99,6 +103,12 @@ class Order(Base):
     status = Column(String, default="pending")
     total_price = Column(Float, nullable=False)
     payment_method = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped by every status change
+
+    __table_args__ = (
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+        Index('ix_orders_customer_id_created_at_id', 'customer_id', 'created_at', 'id'),
+    )
 
     customer = relationship("Customer", back_populates="orders")
     restaurant = relationship("Restaurant", back_populates="orders")
@@ -134,7 +144,8 @@ class FoodItem(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False)
-    image = Column(LargeBinary, nullable=True)
+    image = deferred(Column(LargeBinary, nullable=True))  # Legacy blobs, moved out by utils.image_store
+    image_hash = Column(String, nullable=True)
     discount_start = Column(DateTime, nullable=True)
     discount_end = Column(DateTime, nullable=True)
     discount_price = Column(Float, nullable=True)
@@ -161,6 +172,11 @@ class Notification(Base):
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_notifications_restaurant_id_created_at_id', 'restaurant_id', 'created_at', 'id'),
+        Index('ix_notifications_is_read_created_at', 'is_read', 'created_at'),
+    )
+
     restaurant = relationship("Restaurant", back_populates="notifications")
     order = relationship("Order", back_populates="notifications")
 
@@ -174,6 +190,10 @@ class Rating(Base):
     comment = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_ratings_restaurant_id_created_at_id', 'restaurant_id', 'created_at', 'id'),
+    )
+
     customer = relationship("Customer", back_populates="ratings")
     restaurant = relationship("Restaurant", back_populates="ratings")
     order = relationship("Order", back_populates="ratings")
@@ -183,4 +203,54 @@ class ActiveSession(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     username = Column(String, unique=True, nullable=False)
     token = Column(String, unique=True, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FoodItemPopularity(Base):
+    __tablename__ = 'food_item_popularity'
+    food_item_id = Column(Integer, ForeignKey('food_items.id'), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+
+class NotificationCounter(Base):
+    __tablename__ = 'notification_counters'
+    restaurant_id = Column(Integer, ForeignKey('restaurants.id'), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+class DelivererAvailability(Base):
+    __tablename__ = 'deliverer_availability'
+    deliverer_id = Column(Integer, ForeignKey('deliverers.id'), primary_key=True)
+    open_orders = Column(Integer, nullable=False, default=0)  # Assigned, not yet delivered
+    online_since = Column(DateTime, nullable=True)  # Login time; NULL after logout
+
+    __table_args__ = (
+        Index('ix_deliverer_availability_open_orders_online_since', 'open_orders', 'online_since'),
+    )
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sent or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class DelivererLocation(Base):
+    # Downsampled history of deliverer positions; live pings stay in memory.
+    __tablename__ = 'deliverer_locations'
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    deliverer_id = Column(Integer, ForeignKey('deliverers.id'), nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_deliverer_locations_deliverer_id_recorded_at', 'deliverer_id', 'recorded_at'),
+    )
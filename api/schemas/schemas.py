@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 class UserBase(BaseModel):
     username: str
@@ -102,9 +102,11 @@ class FoodItemUpdate(FoodItemCreate):
 
 class ApproveOrderRequest(BaseModel):
     status: str
+    version: Optional[int] = None
 
 class AssignOrderRequest(BaseModel):
     deliverer_id: int
+    version: Optional[int] = None
 
 class DelivererResponse(BaseModel):
     id: int
@@ -112,6 +114,27 @@ class DelivererResponse(BaseModel):
 
 class StatusUpdate(BaseModel):
     status: str
+    version: Optional[int] = None
+
+class BulkStatusUpdateItem(BaseModel):
+    order_id: int
+    status: str
+    version: Optional[int] = None
+
+class BulkStatusUpdate(BaseModel):
+    updates: list[BulkStatusUpdateItem]
+
+class BulkAssignItem(BaseModel):
+    order_id: int
+    deliverer_id: int
+    version: Optional[int] = None
+
+class BulkAssignRequest(BaseModel):
+    assignments: list[BulkAssignItem]
+
+class LocationPing(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
 
 class OrderResponse(BaseModel):
     id: int
@@ -120,6 +143,7 @@ class OrderResponse(BaseModel):
     deliverer_id: int | None
     deliverer_username: str | None
     delivery_time: str = None
+    version: Optional[int] = None
 
 class OrderItemCreate(BaseModel):
     food_item_id: int
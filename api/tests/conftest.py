@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# main.py creates its tables on import, so point it at a scratch database
+# before any test module imports it.
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "foodie-test.db"))
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ALGORITHM", "HS256")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
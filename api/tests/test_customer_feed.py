@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import main
+from database.database import SessionLocal, engine
+from models.models import Customer, FoodItem, FoodType, Restaurant
+
+client = TestClient(main.app)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+def add_restaurants(db, label: str, count: int, items_per_restaurant: int = 5):
+    food_types = [FoodType(name=f"{label} {i}") for i in range(2)]
+    db.add_all(food_types)
+    db.flush()
+    for _ in range(count):
+        restaurant = Restaurant(name="R", latitude=43.85, longitude=18.41, street="s", city="Sarajevo", stars=4, category="Pizza", distance_limit=10)
+        db.add(restaurant)
+        db.flush()
+        db.add_all(
+            FoodItem(name=f"Item {i}", price=10, type_id=food_types[i % 2].id, restaurant_id=restaurant.id)
+            for i in range(items_per_restaurant)
+        )
+    db.commit()
+    main.restaurant_index.rebuild(db)
+
+
+def feed_statements(username: str) -> tuple:
+    # (restaurants in the feed, statements with a cold menu cache, statements with a warm one)
+    main.menu_cache.bump_all()
+    with count_statements() as cold:
+        feed = client.get(f"/restaurants-with-food-items/{username}").json()
+    with count_statements() as warm:
+        client.get(f"/restaurants-with-food-items/{username}")
+    return len(feed), len(cold), len(warm)
+
+
+def test_feed_statement_count_does_not_grow_with_restaurants():
+    with SessionLocal() as db:
+        db.add(Customer(first_name="A", last_name="B", username="feed", email="feed@x.com", password="x", address="a", latitude=43.86, longitude=18.42))
+        add_restaurants(db, "one", 1)
+        one = feed_statements("feed")
+        add_restaurants(db, "many", 20)
+        many = feed_statements("feed")
+
+    assert one[0] == 1 and many[0] == 21
+    assert one[1:] == many[1:]
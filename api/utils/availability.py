@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models.models import ActiveSession, Deliverer, DelivererAvailability, Order
+from utils.derived import insert_for, run_check_cli
+from utils.session_store import SESSION_TTL_SECONDS
+
+# Per-deliverer open-order count and login time, kept in step by the order
+# transitions and by login/logout so free deliverers are one indexed query.
+# Every function runs in the caller's transaction; the caller commits.
+
+def ensure_availability(db: Session, deliverer_id: int) -> bool:
+    # Creates a missing row from the orders table and reports whether it did.
+    # ON CONFLICT DO NOTHING, so two transactions creating the same row do
+    # not fail on the primary key; the one that loses applies its change
+    # to the other's row instead.
+    if db.get(DelivererAvailability, deliverer_id) is not None:
+        return False
+    open_orders = db.query(func.count(Order.id)).filter(Order.deliverer_id == deliverer_id, Order.status != "delivered").scalar()
+    statement = insert_for(db, DelivererAvailability).values(deliverer_id=deliverer_id, open_orders=open_orders)
+    statement = statement.on_conflict_do_nothing(index_elements=[DelivererAvailability.deliverer_id])
+    return db.execute(statement).rowcount == 1
+
+def add_deliverer(db: Session, deliverer_id: int):
+    db.add(DelivererAvailability(deliverer_id=deliverer_id, open_orders=0))
+
+def adjust_open_orders(db: Session, deliverer_id: int, delta: int):
+    if ensure_availability(db, deliverer_id):
+        # The new row was counted from orders, which already include this change.
+        return
+    db.query(DelivererAvailability).filter(DelivererAvailability.deliverer_id == deliverer_id).update(
+        {DelivererAvailability.open_orders: DelivererAvailability.open_orders + delta}, synchronize_session=False
+    )
+
+def set_online(db: Session, deliverer_id: int, online: bool):
+    ensure_availability(db, deliverer_id)
+    db.query(DelivererAvailability).filter(DelivererAvailability.deliverer_id == deliverer_id).update(
+        {DelivererAvailability.online_since: datetime.utcnow() if online else None}, synchronize_session=False
+    )
+
+def set_offline_by_username(db: Session, username: str):
+    deliverer_ids = db.query(Deliverer.id).filter(Deliverer.username == username).scalar_subquery()
+    db.query(DelivererAvailability).filter(DelivererAvailability.deliverer_id.in_(deliverer_ids)).update(
+        {DelivererAvailability.online_since: None}, synchronize_session=False
+    )
+
+def find_free_deliverers(db: Session, restaurant_id: int) -> list:
+    # Logged in within the session lifetime and nothing left to deliver.
+    online_after = datetime.utcnow() - timedelta(seconds=SESSION_TTL_SECONDS)
+    return db.query(Deliverer.id, Deliverer.username).join(
+        DelivererAvailability, DelivererAvailability.deliverer_id == Deliverer.id
+    ).filter(
+        Deliverer.restaurant_id == restaurant_id,
+        DelivererAvailability.open_orders == 0,
+        DelivererAvailability.online_since >= online_after,
+    ).order_by(Deliverer.id).all()
+
+def _actual_availability(db: Session) -> dict:
+    open_orders = dict(db.query(Order.deliverer_id, func.count(Order.id)).filter(
+        Order.deliverer_id != None, Order.status != "delivered"
+    ).group_by(Order.deliverer_id).all())
+    sessions = dict(db.query(ActiveSession.username, ActiveSession.created_at).all())
+    return {
+        deliverer_id: (open_orders.get(deliverer_id, 0), sessions.get(username))
+        for deliverer_id, username in db.query(Deliverer.id, Deliverer.username)
+    }
+
+def check_availability(db: Session, repair: bool = False) -> list:
+    actual = _actual_availability(db)
+    stored = {row.deliverer_id: row for row in db.query(DelivererAvailability).all()}
+
+    mismatches = []
+    for deliverer_id, (open_orders, online_since) in actual.items():
+        row = stored.get(deliverer_id)
+        if row and row.open_orders == open_orders and (row.online_since is None) == (online_since is None):
+            continue
+        mismatches.append({
+            "deliverer_id": deliverer_id,
+            "stored": (row.open_orders, row.online_since is not None) if row else None,
+            "actual": (open_orders, online_since is not None),
+        })
+        if repair:
+            if row:
+                row.open_orders = open_orders
+                row.online_since = online_since
+            else:
+                db.add(DelivererAvailability(deliverer_id=deliverer_id, open_orders=open_orders, online_since=online_since))
+
+    if repair and mismatches:
+        db.commit()
+    return mismatches
+
+def backfill_availability(db: Session) -> int:
+    return len(check_availability(db, repair=True))
+
+
+if __name__ == "__main__":
+    run_check_cli("Deliverer availability index", check_availability, "deliverer_id", "Deliverer", "deliverers")
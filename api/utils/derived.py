@@ -0,0 +1,48 @@
+import argparse
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# Helpers for the tables kept in step with others (popularity, unread and
+# availability counters, sessions): the upsert they are written with and
+# their backfill/check/repair command line.
+
+# Dialects whose INSERT supports ON CONFLICT.
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+def insert_for(db: Session, table):
+    # INSERT with on_conflict_do_update / on_conflict_do_nothing for the
+    # session's database.
+    name = db.bind.dialect.name
+    dialect = _UPSERT_DIALECTS.get(name)
+    if dialect is None:
+        raise NotImplementedError(f"Upserts are not supported on {name}; use PostgreSQL or SQLite")
+    return dialect.insert(table)
+
+def run_check_cli(description: str, check, key: str, label: str, noun: str, commands: dict | None = None):
+    # python -m utils.<module> backfill|check|repair. check(db, repair) returns
+    # the mismatches as dicts with key, "stored" and "actual"; commands adds
+    # module specific ones as name -> function(db) returning the line to print.
+    from database.database import SessionLocal, engine
+    from models.models import Base
+
+    commands = commands or {}
+    Base.metadata.create_all(bind=engine)
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("command", choices=["backfill", "check", "repair", *commands])
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command in commands:
+            print(commands[args.command](db))
+        elif args.command == "backfill":
+            print(f"Backfilled {len(check(db, repair=True))} {noun}")
+        else:
+            repair = args.command == "repair"
+            mismatches = check(db, repair=repair)
+            for mismatch in mismatches:
+                print(f"{label} {mismatch[key]}: stored {mismatch['stored']}, actual {mismatch['actual']}")
+            print(f"{len(mismatches)} mismatched {noun}" + (" repaired" if repair and mismatches else ""))
+    finally:
+        db.close()
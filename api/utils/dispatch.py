@@ -0,0 +1,104 @@
+import os
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from sqlalchemy.orm import Session
+from models.models import Customer, Order, Restaurant
+from utils.availability import find_free_deliverers
+from utils.geo import calculate_distances
+from utils.order_state import MAX_BULK_OPERATIONS, transition_orders
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISPATCH_ENABLED = os.getenv("DISPATCH_ENABLED", "false").lower() == "true"
+DISPATCH_INTERVAL_SECONDS = float(os.getenv("DISPATCH_INTERVAL_SECONDS", 30))
+# Orders whose customers are within this distance of each other, with
+# delivery times close together, can go out with one deliverer.
+DISPATCH_BATCH_RADIUS_KM = float(os.getenv("DISPATCH_BATCH_RADIUS_KM", 2.0))
+DISPATCH_BATCH_WINDOW_MINUTES = float(os.getenv("DISPATCH_BATCH_WINDOW_MINUTES", 30))
+DISPATCH_MAX_BATCH_SIZE = int(os.getenv("DISPATCH_MAX_BATCH_SIZE", 3))
+
+def plan_batches(
+    restaurant_lat: float,
+    restaurant_lon: float,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    due: np.ndarray,
+    max_batches: int,
+    radius_km: float = DISPATCH_BATCH_RADIUS_KM,
+    window_seconds: float = DISPATCH_BATCH_WINDOW_MINUTES * 60,
+    max_batch_size: int = DISPATCH_MAX_BATCH_SIZE,
+) -> list:
+    # Greedy: the most urgent order (nearest to the restaurant on ties) seeds
+    # a batch, which is filled with the closest remaining orders that are
+    # within radius_km of it and due within the window. Returns lists of
+    # positions into the input arrays, most urgent batch first.
+    from_restaurant = calculate_distances(restaurant_lat, restaurant_lon, lats, lons)
+    order = np.lexsort((from_restaurant, due))
+    remaining = np.ones(len(lats), dtype=bool)
+
+    batches = []
+    for seed in order:
+        if len(batches) >= max_batches:
+            break
+        if not remaining[seed]:
+            continue
+        remaining[seed] = False
+        candidates = np.flatnonzero(remaining & (np.abs(due - due[seed]) <= window_seconds))
+        batch = [int(seed)]
+        if len(candidates) and max_batch_size > 1:
+            distances = calculate_distances(lats[seed], lons[seed], lats[candidates], lons[candidates])
+            close = distances <= radius_km
+            candidates, distances = candidates[close], distances[close]
+            nearest = candidates[np.argsort(distances, kind="stable")[:max_batch_size - 1]]
+            remaining[nearest] = False
+            batch.extend(int(position) for position in nearest)
+        batches.append(batch)
+    return batches
+
+def run_dispatch(db: Session) -> list:
+    # One dispatch cycle over every restaurant. Assignments go through the
+    # versioned transitions, so an order an admin assigned meanwhile is
+    # skipped with a conflict instead of being reassigned.
+    rows = db.query(
+        Order.id, Order.version, Order.restaurant_id, Order.delivery_time, Order.created_at,
+        Customer.latitude, Customer.longitude,
+    ).join(Customer, Customer.id == Order.customer_id).filter(
+        Order.status == "approved",
+        Order.deliverer_id == None,
+    ).all()
+    if not rows:
+        return []
+
+    by_restaurant = defaultdict(list)
+    for row in rows:
+        by_restaurant[row.restaurant_id].append(row)
+    restaurants = {
+        restaurant.id: restaurant
+        for restaurant in db.query(Restaurant.id, Restaurant.latitude, Restaurant.longitude).filter(Restaurant.id.in_(by_restaurant))
+    }
+
+    epoch = datetime(1970, 1, 1)
+    operations = []
+    for restaurant_id, orders in by_restaurant.items():
+        restaurant = restaurants.get(restaurant_id)
+        deliverers = find_free_deliverers(db, restaurant_id)
+        if restaurant is None or not deliverers:
+            continue
+
+        lats = np.array([order.latitude for order in orders], dtype=float)
+        lons = np.array([order.longitude for order in orders], dtype=float)
+        # Orders without a requested time are due as soon as they were placed.
+        due = np.array([((order.delivery_time or order.created_at) - epoch).total_seconds() for order in orders])
+        batches = plan_batches(restaurant.latitude, restaurant.longitude, lats, lons, due, max_batches=len(deliverers))
+
+        for deliverer, batch in zip(deliverers, batches):
+            for position in batch:
+                operations.append((orders[position].id, "assigned", orders[position].version, {"deliverer_id": deliverer.id}))
+
+    results = []
+    for start in range(0, len(operations), MAX_BULK_OPERATIONS):
+        results.extend(transition_orders(db, operations[start:start + MAX_BULK_OPERATIONS]))
+    db.commit()
+    return results
@@ -0,0 +1,150 @@
+import os
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from sqlalchemy.orm import Session
+from models.models import EmailOutbox
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = int(os.getenv("SMTP_PORT") or 587)
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+# Set SMTP_STARTTLS=false for a local debugging server such as
+# `python -m aiosmtpd -n -l localhost:1025`; login is skipped without a password.
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 30))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", 5))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 8))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+
+# The server rejected this one message; the connection itself is still usable.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+def enqueue_email(db: Session, to_email: str, subject: str, body: str):
+    # Added to the caller's transaction, so the email exists only if the
+    # business change commits. The caller commits.
+    db.add(EmailOutbox(to_email=to_email, subject=subject, body=body))
+
+def build_message(to_email: str, subject: str, body: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = SMTP_USER
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class SmtpPool:
+    # Keeps logged in SMTP connections between batches instead of paying
+    # connect, STARTTLS and login for every message.
+
+    def __init__(self, size: int = SMTP_POOL_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if SMTP_STARTTLS:
+                connection.starttls()
+            if SMTP_USER and SMTP_PASSWORD:
+                connection.login(SMTP_USER, SMTP_PASSWORD)
+        except Exception:
+            self.discard(connection)
+            raise
+        return connection
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._connect()
+            try:
+                # Servers close idle connections; make sure this one is still open.
+                if connection.noop()[0] == 250:
+                    return connection
+            except smtplib.SMTPException:
+                pass
+            self.discard(connection)
+
+    def release(self, connection: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        self.discard(connection)
+
+    def discard(self, connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+
+smtp_pool = SmtpPool()
+
+def _schedule_retry(entry: EmailOutbox, error: Exception, now: datetime):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= EMAIL_MAX_ATTEMPTS:
+        entry.status = "failed"
+        return
+    delay = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (entry.attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+    entry.next_attempt_at = now + timedelta(seconds=delay)
+
+def send_batch(db: Session, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE) -> int:
+    now = datetime.utcnow()
+    # SKIP LOCKED lets several workers drain the outbox without sending twice.
+    entries = db.query(EmailOutbox).filter(
+        EmailOutbox.status == "pending",
+        EmailOutbox.next_attempt_at <= now,
+    ).order_by(EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    connection = None
+    for position, entry in enumerate(entries):
+        if connection is None:
+            try:
+                connection = smtp_pool.acquire()
+            except Exception as e:
+                # The mail server is unreachable; retry the rest later.
+                for pending in entries[position:]:
+                    _schedule_retry(pending, e, now)
+                break
+        try:
+            msg = build_message(entry.to_email, entry.subject, entry.body)
+            connection.sendmail(SMTP_USER, [entry.to_email], msg.as_string())
+        except MESSAGE_ERRORS as e:
+            _schedule_retry(entry, e, now)
+        except Exception as e:
+            _schedule_retry(entry, e, now)
+            if connection is not None:
+                smtp_pool.discard(connection)
+                connection = None
+        else:
+            entry.status = "sent"
+            entry.sent_at = datetime.utcnow()
+            entry.last_error = None
+
+    if connection is not None:
+        smtp_pool.release(connection)
+    db.commit()
+    return len(entries)
+
+def drain_outbox(db: Session, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE) -> int:
+    processed = 0
+    while True:
+        count = send_batch(db, batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
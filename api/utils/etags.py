@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ETags embed a per-process token so a restarted or different worker never
+# answers 304 for a version number it did not issue.
+_INSTANCE_TOKEN = uuid.uuid4().hex[:12]
+# Versions only count changes made through this process, so ETags also carry
+# the current time window: a client holding one gets a fresh body at least
+# this often even when the change went through another worker.
+ETAG_MAX_AGE_SECONDS = float(os.getenv("ETAG_MAX_AGE_SECONDS", 60))
+
+class ChangeVersions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, name: str) -> int:
+        return self._versions.get(name, 0)
+
+    def bump(self, name: str):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+
+def make_etag(*parts) -> str:
+    window = int(time.time() // ETAG_MAX_AGE_SECONDS)
+    return '"' + "-".join([_INSTANCE_TOKEN, str(window), *[str(part) for part in parts]]) + '"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in client_etags or "*" in client_etags
+
+
+change_versions = ChangeVersions()
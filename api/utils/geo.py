@@ -0,0 +1,129 @@
+import math
+import threading
+from collections import defaultdict
+import numpy as np
+from sqlalchemy.orm import Session
+from models.models import Restaurant
+
+EARTH_RADIUS_KM = 6371.0
+GRID_CELL_DEGREES = 0.1
+MAX_CELLS_PER_RESTAURANT = 40000
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM
+
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    distance = R * c
+
+    return distance
+
+def calculate_distances(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    # Same formula as calculate_distance, one point against many.
+    lat1_rad = np.radians(lat)
+    lon1_rad = np.radians(lon)
+    lat2_rad = np.radians(lats)
+    lon2_rad = np.radians(lons)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+class RestaurantGridIndex:
+    # Each active restaurant is registered in every lat/lon grid cell its
+    # delivery radius can reach, so a lookup only has to check the
+    # restaurants bucketed under the customer's own cell.
+
+    def __init__(self, cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._lon_cell_count = round(360 / cell_degrees)
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        # Longitude cells wrap around the antimeridian.
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees) % self._lon_cell_count)
+
+    def _covered_cells(self, lat: float, lon: float, distance_limit: float):
+        angle = distance_limit / EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        max_abs_lat = abs(lat) + dlat
+        if max_abs_lat >= 90:
+            return None
+
+        # Widest longitude offset a point within the radius can have: from the
+        # haversine formula, sin(dlon/2) <= sin(angle/2) / cos(lat) on both ends.
+        spread = math.sin(min(angle, math.pi) / 2) / math.cos(math.radians(max_abs_lat))
+        if spread >= 1:
+            return None
+        dlon = math.degrees(2 * math.asin(spread))
+
+        # One extra cell on every side absorbs floating point error at the edges.
+        lat_cells = range(math.floor((lat - dlat) / self.cell_degrees) - 1, math.floor((lat + dlat) / self.cell_degrees) + 2)
+        lon_cells = range(math.floor((lon - dlon) / self.cell_degrees) - 1, math.floor((lon + dlon) / self.cell_degrees) + 2)
+        if len(lon_cells) >= self._lon_cell_count or len(lat_cells) * len(lon_cells) > MAX_CELLS_PER_RESTAURANT:
+            return None
+        return [(lat_cell, lon_cell % self._lon_cell_count) for lat_cell in lat_cells for lon_cell in lon_cells]
+
+    def rebuild(self, db: Session):
+        rows = db.query(Restaurant.id, Restaurant.latitude, Restaurant.longitude, Restaurant.distance_limit).filter(
+            Restaurant.is_active == True
+        ).order_by(Restaurant.id).all()
+
+        buckets = defaultdict(list)
+        everywhere = []
+        for position, (_, latitude, longitude, distance_limit) in enumerate(rows):
+            cells = self._covered_cells(latitude, longitude, distance_limit)
+            if cells is None:
+                everywhere.append(position)
+                continue
+            for cell in cells:
+                buckets[cell].append(position)
+
+        snapshot = {
+            "ids": np.array([row[0] for row in rows], dtype=np.int64),
+            "latitudes": np.array([row[1] for row in rows], dtype=np.float64),
+            "longitudes": np.array([row[2] for row in rows], dtype=np.float64),
+            "limits": np.array([row[3] for row in rows], dtype=np.float64),
+            "buckets": {cell: np.array(positions, dtype=np.int64) for cell, positions in buckets.items()},
+            "everywhere": np.array(everywhere, dtype=np.int64),
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def reachable_restaurant_ids(self, db: Session, latitude: float, longitude: float) -> list:
+        snapshot = self._snapshot or self.rebuild(db)
+
+        bucket = snapshot["buckets"].get(self._cell(latitude, longitude))
+        candidates = snapshot["everywhere"] if bucket is None else np.union1d(bucket, snapshot["everywhere"])
+        if not len(candidates):
+            return []
+
+        latitudes = snapshot["latitudes"][candidates]
+        longitudes = snapshot["longitudes"][candidates]
+        limits = snapshot["limits"][candidates]
+        distances = calculate_distances(latitude, longitude, latitudes, longitudes)
+        reachable = distances <= limits
+
+        # NumPy and math may round the last bit differently; settle anything
+        # that close to the limit with the scalar function.
+        for i in np.flatnonzero(np.abs(distances - limits) <= 1e-9 * np.maximum(limits, 1.0)):
+            reachable[i] = calculate_distance(latitude, longitude, latitudes[i], longitudes[i]) <= limits[i]
+
+        return snapshot["ids"][candidates[reachable]].tolist()
+
+
+restaurant_index = RestaurantGridIndex()
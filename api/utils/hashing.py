@@ -1,9 +1,119 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from dotenv import load_dotenv
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Size of the threadpool sync handlers run on (AnyIO's default is 40).
+REQUEST_THREADPOOL_SIZE = int(os.getenv("REQUEST_THREADPOOL_SIZE", 40))
+# Hashing jobs running or waiting at once; more are turned away with 503.
+# Sync login and registration handlers hold a request thread while they
+# wait, so this stays well below REQUEST_THREADPOOL_SIZE and a login storm
+# leaves threads for every other endpoint.
+HASHING_MAX_IN_FLIGHT = int(os.getenv("HASHING_MAX_IN_FLIGHT", max(REQUEST_THREADPOOL_SIZE // 4, 1)))
+HASHING_WORKERS = min(int(os.getenv("HASHING_WORKERS", os.cpu_count() or 1)), HASHING_MAX_IN_FLIGHT)
+
+# Pinning min and max rounds makes needs_update flag hashes made with another cost.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+def needs_rehash(hashed_password):
+    return pwd_context.needs_update(hashed_password)
+
+
+class PasswordHasher:
+    # Runs bcrypt on a dedicated, bounded pool so a login storm cannot take
+    # every request thread or block the event loop. bcrypt releases the GIL,
+    # so threads hash in parallel.
+
+    def __init__(self, workers: int = HASHING_WORKERS, max_in_flight: int = HASHING_MAX_IN_FLIGHT):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def _run(self, func, submitted_at: float, *args):
+        started_at = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.wait_seconds += started_at - submitted_at
+
+    def _reserve(self):
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Server busy, please try again", headers={"Retry-After": "1"})
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def _submit(self, func, *args):
+        self._reserve()
+        try:
+            future = self._executor.submit(self._run, func, time.monotonic(), *args)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._release()
+
+    def _submit_blocking(self, func, *args):
+        # For sync handlers, which already run on the request threadpool and
+        # do blocking database work around the hash.
+        self._reserve()
+        try:
+            return self._executor.submit(self._run, func, time.monotonic(), *args).result()
+        finally:
+            self._release()
+
+    async def verify(self, plain_password, hashed_password) -> bool:
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password) -> str:
+        return await self._submit(get_password_hash, password)
+
+    def verify_blocking(self, plain_password, hashed_password) -> bool:
+        return self._submit_blocking(verify_password, plain_password, hashed_password)
+
+    def hash_blocking(self, password) -> str:
+        return self._submit_blocking(get_password_hash, password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": self.wait_seconds / self.completed if self.completed else 0.0,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+            }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+from typing import Optional
+from fastapi import Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from utils.cache import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 100000))
+# How long a duplicate waits for the first request before giving up with 409.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 30))
+
+def _still_running() -> HTTPException:
+    return HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+
+class _Execution:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None
+        self.succeeded = False
+
+
+class IdempotencyStore:
+    # Remembers the response of a successful request per Idempotency-Key and
+    # replays it for retries. Failed requests are forgotten so they can be
+    # retried. Keys are per worker process.
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._running = {}
+        self._completed = TTLCache(maxsize=max_keys, ttl=ttl)
+
+    def _begin(self, key, fingerprint: str):
+        # Returns (execution, is_owner); the owner runs the handler.
+        with self._lock:
+            execution = self._completed.get(key) or self._running.get(key)
+            if execution is None:
+                execution = self._running[key] = _Execution(fingerprint)
+                return execution, True
+        if execution.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return execution, False
+
+    def _finish(self, key, execution: _Execution, response=None, succeeded: bool = False):
+        with self._lock:
+            self._running.pop(key, None)
+            if succeeded:
+                execution.response = response
+                execution.succeeded = True
+                self._completed.set(key, execution)
+        execution.done.set()
+
+    def run(self, key, fingerprint: str, func):
+        while True:
+            execution, is_owner = self._begin(key, fingerprint)
+            if is_owner:
+                break
+            if not execution.done.wait(IDEMPOTENCY_WAIT_SECONDS):
+                raise _still_running()
+            if execution.succeeded:
+                return execution.response
+            # The first attempt failed, so this one runs the handler again.
+
+        try:
+            response = jsonable_encoder(func())
+        except BaseException:
+            self._finish(key, execution)
+            raise
+        self._finish(key, execution, response, succeeded=True)
+        return response
+
+    async def run_async(self, key, fingerprint: str, func):
+        while True:
+            execution, is_owner = self._begin(key, fingerprint)
+            if is_owner:
+                break
+            # Wait off the event loop; the first request may be a sync handler.
+            if not execution.done.is_set() and not await asyncio.to_thread(execution.done.wait, IDEMPOTENCY_WAIT_SECONDS):
+                raise _still_running()
+            if execution.succeeded:
+                return execution.response
+
+        try:
+            response = jsonable_encoder(await func())
+        except BaseException:
+            self._finish(key, execution)
+            raise
+        self._finish(key, execution, response, succeeded=True)
+        return response
+
+
+idempotency_store = IdempotencyStore()
+
+def _fingerprint(kwargs: dict) -> str:
+    payload = {name: value for name, value in kwargs.items() if not isinstance(value, Session)}
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True, default=str).encode()).hexdigest()
+
+def idempotent(scope: str):
+    # Adds an optional Idempotency-Key header to an endpoint. With the header
+    # set, retries get the first successful response instead of running the
+    # handler again, and concurrent duplicates wait for the first one.
+    def decorator(func):
+        signature = inspect.signature(func)
+        key_parameter = inspect.Parameter(
+            "idempotency_key",
+            inspect.Parameter.KEYWORD_ONLY,
+            default=Header(None),
+            annotation=Optional[str],
+        )
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, idempotency_key: Optional[str] = None, **kwargs):
+                if idempotency_key is None:
+                    return await func(*args, **kwargs)
+                return await idempotency_store.run_async((scope, idempotency_key), _fingerprint(kwargs), lambda: func(*args, **kwargs))
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, idempotency_key: Optional[str] = None, **kwargs):
+                if idempotency_key is None:
+                    return func(*args, **kwargs)
+                return idempotency_store.run((scope, idempotency_key), _fingerprint(kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), key_parameter])
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import re
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_store")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def is_valid_hash(image_hash: str) -> bool:
+    return bool(_HASH_RE.match(image_hash))
+
+def image_path(image_hash: str) -> str:
+    return os.path.join(IMAGE_STORE_DIR, image_hash[:2], image_hash)
+
+def image_url(image_hash: str | None) -> str | None:
+    return f"/images/{image_hash}" if image_hash else None
+
+def save_image(data: bytes) -> str:
+    image_hash = hashlib.sha256(data).hexdigest()
+    path = image_path(image_hash)
+    if os.path.exists(path):
+        return image_hash
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temp file first so a concurrent reader never sees a partial image.
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return image_hash
+
+def guess_media_type(path: str) -> str:
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header.startswith(b"\x89PNG"):
+        return "image/png"
+    if header.startswith(b"GIF8"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+def migrate_food_item_images(db, engine, batch_size: int = 100) -> int:
+    from sqlalchemy import inspect, text
+    from models.models import FoodItem
+
+    columns = [column["name"] for column in inspect(engine).get_columns("food_items")]
+    if "image_hash" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE food_items ADD COLUMN image_hash VARCHAR"))
+
+    moved = 0
+    while True:
+        rows = db.query(FoodItem.id, FoodItem.image).filter(FoodItem.image != None).limit(batch_size).all()
+        if not rows:
+            break
+        for food_item_id, data in rows:
+            db.query(FoodItem).filter(FoodItem.id == food_item_id).update(
+                {FoodItem.image_hash: save_image(data), FoodItem.image: None}, synchronize_session=False
+            )
+        db.commit()
+        moved += len(rows)
+    return moved
+
+
+if __name__ == "__main__":
+    from database.database import SessionLocal, engine
+
+    db = SessionLocal()
+    try:
+        print(f"Moved {migrate_food_item_images(db, engine)} food item images to {IMAGE_STORE_DIR}")
+    finally:
+        db.close()
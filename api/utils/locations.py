@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from models.models import Deliverer, DelivererLocation
+from utils.pubsub import pubsub
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pings kept in memory per deliverer; at one ping every 5 seconds the
+# default covers the last 10 minutes.
+LOCATION_BUFFER_SIZE = int(os.getenv("LOCATION_BUFFER_SIZE", 120))
+LOCATION_PERSIST_INTERVAL_SECONDS = float(os.getenv("LOCATION_PERSIST_INTERVAL_SECONDS", 60))
+# At most one persisted position per deliverer per this many seconds.
+LOCATION_DOWNSAMPLE_SECONDS = float(os.getenv("LOCATION_DOWNSAMPLE_SECONDS", 30))
+LOCATION_RETENTION_DAYS = float(os.getenv("LOCATION_RETENTION_DAYS", 7))
+LOCATION_PURGE_BATCH_SIZE = int(os.getenv("LOCATION_PURGE_BATCH_SIZE", 1000))
+
+def location_topic(deliverer_id: int) -> tuple:
+    return ("location", deliverer_id)
+
+def serialize_location(deliverer_id: int, latitude: float, longitude: float, recorded_at: float) -> dict:
+    return {
+        "deliverer_id": deliverer_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "recorded_at": datetime.utcfromtimestamp(recorded_at).isoformat(),
+    }
+
+
+class LocationRing:
+    # Fixed-size buffer of one deliverer's latest pings, oldest overwritten.
+
+    def __init__(self, size: int):
+        self.times = np.zeros(size)
+        self.latitudes = np.zeros(size)
+        self.longitudes = np.zeros(size)
+        self.count = 0
+        self.persisted_until = 0.0
+
+    def append(self, latitude: float, longitude: float, recorded_at: float):
+        position = self.count % len(self.times)
+        self.times[position] = recorded_at
+        self.latitudes[position] = latitude
+        self.longitudes[position] = longitude
+        self.count += 1
+
+    def _positions(self) -> np.ndarray:
+        # Buffer positions from oldest to newest.
+        size = len(self.times)
+        if self.count <= size:
+            return np.arange(self.count)
+        return (np.arange(size) + self.count) % size
+
+    def latest(self):
+        if not self.count:
+            return None
+        position = (self.count - 1) % len(self.times)
+        return float(self.latitudes[position]), float(self.longitudes[position]), float(self.times[position])
+
+    def points(self, since: float = 0.0) -> tuple:
+        positions = self._positions()
+        positions = positions[self.times[positions] > since]
+        return self.latitudes[positions], self.longitudes[positions], self.times[positions]
+
+    def downsample(self, interval: float) -> tuple:
+        # Pings not yet persisted, thinned to at most one per interval.
+        latitudes, longitudes, times = self.points(self.persisted_until)
+        keep = []
+        last = self.persisted_until
+        for position, recorded_at in enumerate(times):
+            if recorded_at - last >= interval:
+                keep.append(position)
+                last = recorded_at
+        return latitudes[keep], longitudes[keep], times[keep]
+
+
+class LocationTracker:
+    # Live deliverer positions. Pings only touch memory and the in-process
+    # pubsub; a scheduler job writes a downsampled trail to the database.
+    # Like the other in-process stores, each worker only sees its own pings.
+
+    def __init__(self, buffer_size: int = LOCATION_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._rings = {}
+        self._usernames = {}
+
+    def username_of(self, deliverer_id: int):
+        return self._usernames.get(deliverer_id)
+
+    def load_username(self, db: Session, deliverer_id: int):
+        # Looked up once per deliverer, so pings can be authorized without a
+        # query and unknown ids cannot grow the buffers.
+        username = self.username_of(deliverer_id)
+        if username is None:
+            username = db.query(Deliverer.username).filter(Deliverer.id == deliverer_id).scalar()
+            if username is not None:
+                with self._lock:
+                    self._usernames[deliverer_id] = username
+        return username
+
+    def record(self, deliverer_id: int, latitude: float, longitude: float) -> dict:
+        recorded_at = time.time()
+        with self._lock:
+            ring = self._rings.get(deliverer_id)
+            if ring is None:
+                ring = self._rings[deliverer_id] = LocationRing(self.buffer_size)
+            ring.append(latitude, longitude, recorded_at)
+        event = serialize_location(deliverer_id, latitude, longitude, recorded_at)
+        pubsub.publish(location_topic(deliverer_id), event)
+        return event
+
+    def latest(self, deliverer_id: int):
+        with self._lock:
+            ring = self._rings.get(deliverer_id)
+            latest = ring.latest() if ring else None
+        return serialize_location(deliverer_id, *latest) if latest else None
+
+    def trail(self, deliverer_id: int, since: float = 0.0) -> list:
+        with self._lock:
+            ring = self._rings.get(deliverer_id)
+            if ring is None:
+                return []
+            latitudes, longitudes, times = ring.points(since)
+        return [
+            serialize_location(deliverer_id, float(latitude), float(longitude), float(recorded_at))
+            for latitude, longitude, recorded_at in zip(latitudes, longitudes, times)
+        ]
+
+    def persist(self, db: Session, interval: float = LOCATION_DOWNSAMPLE_SECONDS) -> int:
+        rows = []
+        watermarks = {}
+        with self._lock:
+            for deliverer_id, ring in self._rings.items():
+                latitudes, longitudes, times = ring.downsample(interval)
+                if not len(times):
+                    continue
+                watermarks[deliverer_id] = float(times[-1])
+                rows.extend(
+                    {
+                        "deliverer_id": deliverer_id,
+                        "latitude": float(latitude),
+                        "longitude": float(longitude),
+                        "recorded_at": datetime.utcfromtimestamp(recorded_at),
+                    }
+                    for latitude, longitude, recorded_at in zip(latitudes, longitudes, times)
+                )
+        if not rows:
+            return 0
+
+        db.execute(insert(DelivererLocation), rows)
+        db.commit()
+        # Moved only after the commit, so a failed write is retried next run.
+        with self._lock:
+            for deliverer_id, persisted_until in watermarks.items():
+                ring = self._rings[deliverer_id]
+                ring.persisted_until = max(ring.persisted_until, persisted_until)
+        return len(rows)
+
+
+location_tracker = LocationTracker()
+
+def latest_locations(db: Session, deliverer_ids: set) -> list:
+    # Live positions, falling back to the last persisted one for deliverers
+    # that have not pinged this worker.
+    locations = {}
+    for deliverer_id in deliverer_ids:
+        location = location_tracker.latest(deliverer_id)
+        if location is not None:
+            locations[deliverer_id] = location
+
+    missing = set(deliverer_ids) - set(locations)
+    if missing:
+        newest = db.query(
+            DelivererLocation.deliverer_id,
+            func.max(DelivererLocation.recorded_at).label("recorded_at"),
+        ).filter(DelivererLocation.deliverer_id.in_(missing)).group_by(DelivererLocation.deliverer_id).subquery()
+        rows = db.query(DelivererLocation).join(
+            newest,
+            (DelivererLocation.deliverer_id == newest.c.deliverer_id) & (DelivererLocation.recorded_at == newest.c.recorded_at),
+        ).all()
+        for row in rows:
+            locations[row.deliverer_id] = {
+                "deliverer_id": row.deliverer_id,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "recorded_at": row.recorded_at.isoformat(),
+            }
+    return list(locations.values())
+
+def purge_old_locations(db: Session, older_than_days: float = LOCATION_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    purged = 0
+    while True:
+        ids = [row[0] for row in db.query(DelivererLocation.id).filter(
+            DelivererLocation.recorded_at < cutoff,
+        ).limit(LOCATION_PURGE_BATCH_SIZE)]
+        if not ids:
+            return purged
+        db.query(DelivererLocation).filter(DelivererLocation.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        purged += len(ids)
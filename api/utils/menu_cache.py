@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MENU_CACHE_MAX_BYTES = int(os.getenv("MENU_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Upper bound on how long a menu edit made through another worker goes unseen.
+MENU_CACHE_TTL_SECONDS = float(os.getenv("MENU_CACHE_TTL_SECONDS", 60))
+
+class MenuCache:
+    # Built menu payloads keyed by (restaurant_id, version). Every menu write
+    # bumps the restaurant's version in this process; edits made through
+    # another worker are picked up once the entry's ttl runs out.
+
+    def __init__(self, max_bytes: int = MENU_CACHE_MAX_BYTES, ttl: float = MENU_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._base_version = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, restaurant_id: int) -> int:
+        return self._versions.get(restaurant_id, self._base_version)
+
+    def bump(self, *restaurant_ids):
+        with self._lock:
+            for restaurant_id in restaurant_ids:
+                if restaurant_id is None:
+                    continue
+                version = self.version(restaurant_id)
+                self._versions[restaurant_id] = version + 1
+                self._remove((restaurant_id, version))
+
+    def bump_all(self):
+        # Used when shared data such as food type names changes.
+        with self._lock:
+            self._base_version = max([self._base_version, *self._versions.values()]) + 1
+            self._versions.clear()
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, restaurant_id: int, version: int):
+        with self._lock:
+            entry = self._entries.get((restaurant_id, version))
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove((restaurant_id, version))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((restaurant_id, version))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, restaurant_id: int, version: int, payload):
+        size = len(json.dumps(payload, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # A menu edit landed while this payload was being built.
+            if version != self.version(restaurant_id):
+                return
+            key = (restaurant_id, version)
+            self._remove(key)
+            self._entries[key] = (payload, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                evicted_key = next(iter(self._entries))
+                self._remove(evicted_key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+menu_cache = MenuCache()
@@ -0,0 +1,96 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from models.models import Notification, NotificationCounter
+from utils.derived import insert_for, run_check_cli
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NOTIFICATION_RETENTION_DAYS = float(os.getenv("NOTIFICATION_RETENTION_DAYS", 30))
+NOTIFICATION_PURGE_BATCH_SIZE = 1000
+
+def get_unread_count(db: Session, restaurant_id: int) -> int:
+    count = db.query(NotificationCounter.unread_count).filter(NotificationCounter.restaurant_id == restaurant_id).scalar()
+    return max(count or 0, 0)
+
+def increment_unread(db: Session, restaurant_id: int):
+    # Called inside the transaction that adds the notification; the caller
+    # commits. An upsert, so concurrent first orders for a restaurant do not
+    # collide on the counter's primary key.
+    statement = insert_for(db, NotificationCounter).values(restaurant_id=restaurant_id, unread_count=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[NotificationCounter.restaurant_id],
+        set_={"unread_count": NotificationCounter.unread_count + 1},
+    )
+    db.execute(statement)
+
+def mark_read(db: Session, restaurant_id: int, up_to_id: int | None = None) -> int:
+    # Marks unread notifications up to up_to_id (all when None) as read and
+    # moves the counter by the rows actually changed, never below zero. The
+    # notifications are updated even when the counter is missing or off.
+    # The caller commits.
+    query = db.query(Notification).filter(Notification.restaurant_id == restaurant_id, Notification.is_read == False)
+    if up_to_id is not None:
+        query = query.filter(Notification.id <= up_to_id)
+    updated = query.update({Notification.is_read: True}, synchronize_session=False)
+    if updated:
+        db.query(NotificationCounter).filter(NotificationCounter.restaurant_id == restaurant_id).update(
+            {NotificationCounter.unread_count: case(
+                (NotificationCounter.unread_count > updated, NotificationCounter.unread_count - updated),
+                else_=0,
+            )},
+            synchronize_session=False,
+        )
+    return updated
+
+def purge_read_notifications(db: Session, older_than_days: float = NOTIFICATION_RETENTION_DAYS) -> int:
+    # Read notifications are only history; deleting old ones keeps the table
+    # small. Unread ones are kept whatever their age.
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    purged = 0
+    while True:
+        ids = [row[0] for row in db.query(Notification.id).filter(
+            Notification.is_read == True,
+            Notification.created_at < cutoff,
+        ).limit(NOTIFICATION_PURGE_BATCH_SIZE)]
+        if not ids:
+            return purged
+        db.query(Notification).filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        purged += len(ids)
+
+def check_unread_counters(db: Session, repair: bool = False) -> list:
+    actual = dict(db.query(Notification.restaurant_id, func.count(Notification.id)).filter(
+        Notification.is_read == False
+    ).group_by(Notification.restaurant_id).all())
+    stored = {row.restaurant_id: row for row in db.query(NotificationCounter).all()}
+
+    mismatches = []
+    for restaurant_id in set(actual) | set(stored):
+        expected = actual.get(restaurant_id, 0)
+        row = stored.get(restaurant_id)
+        current = row.unread_count if row else 0
+        if expected == current:
+            continue
+        mismatches.append({"restaurant_id": restaurant_id, "stored": current, "actual": expected})
+        if repair:
+            if row:
+                row.unread_count = expected
+            else:
+                db.add(NotificationCounter(restaurant_id=restaurant_id, unread_count=expected))
+
+    if repair and mismatches:
+        db.commit()
+    return mismatches
+
+def backfill_unread_counters(db: Session) -> int:
+    return len(check_unread_counters(db, repair=True))
+
+
+if __name__ == "__main__":
+    run_check_cli(
+        "Restaurant notification counters and retention", check_unread_counters, "restaurant_id", "Restaurant", "unread counters",
+        commands={"purge": lambda db: f"Purged {purge_read_notifications(db)} read notifications older than {NOTIFICATION_RETENTION_DAYS:g} days"},
+    )
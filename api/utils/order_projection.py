@@ -0,0 +1,113 @@
+from sqlalchemy.orm import Session
+from models.models import Customer, Deliverer, FoodItem, OrderFoodItem, Restaurant
+
+class OrderProjection:
+    # Loads what the order views need for a whole list of orders with one IN
+    # query per relation, so the query count does not grow with the list.
+
+    def __init__(self, db: Session, orders: list, relations: set):
+        self.customers = {}
+        self.restaurants = {}
+        self.deliverers = {}
+        self.lines = {}
+
+        if "customer" in relations:
+            self.customers = self._by_id(db, orders, "customer_id", Customer.id, Customer.username, Customer.first_name, Customer.last_name, Customer.address, Customer.email)
+        if "restaurant" in relations:
+            self.restaurants = self._by_id(db, orders, "restaurant_id", Restaurant.id, Restaurant.name, Restaurant.street, Restaurant.city)
+        if "deliverer" in relations:
+            self.deliverers = self._by_id(db, orders, "deliverer_id", Deliverer.id, Deliverer.username)
+        if "food_items" in relations and orders:
+            rows = db.query(OrderFoodItem.order_id, OrderFoodItem.quantity, FoodItem.name, FoodItem.price).join(
+                FoodItem, FoodItem.id == OrderFoodItem.food_item_id
+            ).filter(OrderFoodItem.order_id.in_([order.id for order in orders])).all()
+            for row in rows:
+                self.lines.setdefault(row.order_id, []).append(row)
+
+    @staticmethod
+    def _by_id(db: Session, orders: list, foreign_key: str, id_column, *columns) -> dict:
+        ids = {getattr(order, foreign_key) for order in orders} - {None}
+        if not ids:
+            return {}
+        return {row.id: row for row in db.query(id_column, *columns).filter(id_column.in_(ids))}
+
+
+def _admin_view(order, projection: OrderProjection) -> dict:
+    deliverer = projection.deliverers.get(order.deliverer_id)
+    restaurant = projection.restaurants.get(order.restaurant_id)
+    customer = projection.customers.get(order.customer_id)
+    return {
+        "id": order.id,
+        "status": order.status,
+        "version": order.version,
+        "total_price": order.total_price,
+        "deliverer_id": order.deliverer_id,
+        "deliverer_username": deliverer.username if deliverer else None,
+        "delivery_time": order.delivery_time.strftime("%Y-%m-%d %H:%M:%S") if order.delivery_time else "No delivery time set",
+        "restaurant": {
+            "name": restaurant.name if restaurant else None,
+        },
+        "customer": {
+            "name": f"{customer.first_name} {customer.last_name}" if customer else None,
+            "address": customer.address if customer else None,
+            "email": customer.email if customer else None,
+        },
+    }
+
+def _customer_view(order, projection: OrderProjection) -> dict:
+    restaurant = projection.restaurants.get(order.restaurant_id)
+    return {
+        "id": order.id,
+        "created_at": order.created_at,
+        "delivery_time": order.delivery_time,
+        "delivered_time": order.delivered_time,
+        "status": order.status,
+        "total_price": order.total_price,
+        "payment_method": order.payment_method,
+        "restaurant_name": restaurant.name if restaurant else "Unknown",
+        "food_items": [
+            {"name": line.name, "quantity": line.quantity, "price": line.price}
+            for line in projection.lines.get(order.id, [])
+        ],
+    }
+
+def _deliverer_view(order, projection: OrderProjection) -> dict:
+    customer = projection.customers.get(order.customer_id)
+    restaurant = projection.restaurants.get(order.restaurant_id)
+    lines = projection.lines.get(order.id, [])
+    return {
+        "id": order.id,
+        "customer": {
+            "name": f"{customer.first_name} {customer.last_name}" if customer else None,
+            "username": customer.username if customer else None,
+            "address": customer.address if customer else None,
+        },
+        "restaurant": {
+            "name": restaurant.name if restaurant else None,
+            "street": restaurant.street if restaurant else None,
+            "city": restaurant.city if restaurant else None,
+        },
+        "total_price": order.total_price,
+        "quantity": sum(line.quantity for line in lines),
+        "status": order.status,
+        "version": order.version,
+        "payment_method": order.payment_method,
+        "delivery_time": order.delivery_time,
+        "delivered_time": order.delivered_time,
+        "food_items": [
+            {"name": line.name, "quantity": line.quantity, "price": line.price, "total": line.quantity * line.price}
+            for line in lines
+        ],
+    }
+
+# view name -> (relations to load, serializer)
+ORDER_VIEWS = {
+    "admin": ({"customer", "restaurant", "deliverer"}, _admin_view),
+    "customer": ({"restaurant", "food_items"}, _customer_view),
+    "deliverer": ({"customer", "restaurant", "food_items"}, _deliverer_view),
+}
+
+def project_orders(db: Session, orders: list, view: str) -> list:
+    relations, serialize = ORDER_VIEWS[view]
+    projection = OrderProjection(db, orders, relations)
+    return [serialize(order, projection) for order in orders]
@@ -0,0 +1,101 @@
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from models.models import Order
+from utils.availability import adjust_open_orders, ensure_availability
+
+ORDER_STATUSES = ["pending", "approved", "assigned", "in_transit", "delivered"]
+
+# Allowed next statuses. Besides the happy path, an assigned order may be
+# reassigned or marked delivered directly, and a delivered order may be reset
+# to assigned when the deliverer marked it by mistake.
+ORDER_TRANSITIONS = {
+    "pending": {"approved"},
+    "approved": {"assigned"},
+    "assigned": {"assigned", "in_transit", "delivered"},
+    "in_transit": {"delivered"},
+    "delivered": {"assigned"},
+}
+
+MAX_BULK_OPERATIONS = 200
+
+def _apply_transition(db: Session, order_id: int, current, new_status: str, expected_version: int | None, values: dict) -> int:
+    if new_status not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown order status: {new_status}")
+    if current is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    status, version, deliverer_id = current
+    if expected_version is not None and expected_version != version:
+        raise HTTPException(status_code=409, detail="Order was modified by someone else")
+    if new_status not in ORDER_TRANSITIONS.get(status, set()):
+        raise HTTPException(status_code=409, detail=f"Cannot change order status from {status} to {new_status}")
+
+    updated = db.query(Order).filter(Order.id == order_id, Order.version == version).update(
+        {Order.status: new_status, Order.version: version + 1, **values}, synchronize_session=False
+    )
+    if not updated:
+        raise HTTPException(status_code=409, detail="Order was modified by someone else")
+
+    new_deliverer_id = values.get("deliverer_id", deliverer_id)
+    was_open = deliverer_id is not None and status != "delivered"
+    is_open = new_deliverer_id is not None and new_status != "delivered"
+    if was_open and is_open and new_deliverer_id == deliverer_id:
+        # Still open with the same deliverer (e.g. assigned -> in_transit):
+        # the count does not change. Adjusting by -1 and +1 would over-count
+        # a deliverer whose row the first adjustment creates from orders.
+        ensure_availability(db, deliverer_id)
+    else:
+        if was_open:
+            adjust_open_orders(db, deliverer_id, -1)
+        if is_open:
+            adjust_open_orders(db, new_deliverer_id, 1)
+    return version + 1
+
+def transition_order(db: Session, order_id: int, new_status: str, expected_version: int | None = None, **values) -> int:
+    # Compare-and-set on orders.version instead of a row lock: the UPDATE only
+    # matches if nobody changed the order since it was read. Raises 409 on a
+    # conflict and returns the new version. The caller commits.
+    current = db.query(Order.status, Order.version, Order.deliverer_id).filter(Order.id == order_id).first()
+    return _apply_transition(db, order_id, current, new_status, expected_version, values)
+
+def transition_orders(db: Session, operations: list) -> list:
+    # Applies (order_id, status, expected_version, values) operations in the
+    # caller's transaction. Each one succeeds or fails on its own; failures
+    # are reported per item instead of aborting the batch.
+    if len(operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations per request")
+
+    order_ids = {order_id for order_id, _, _, _ in operations}
+    current = {
+        row.id: (row.status, row.version, row.deliverer_id)
+        for row in db.query(Order.id, Order.status, Order.version, Order.deliverer_id).filter(Order.id.in_(order_ids))
+    }
+
+    results = []
+    for order_id, new_status, expected_version, values in operations:
+        try:
+            version = _apply_transition(db, order_id, current.get(order_id), new_status, expected_version, values)
+        except HTTPException as e:
+            results.append({"order_id": order_id, "status_code": e.status_code, "detail": e.detail})
+            continue
+        current[order_id] = (new_status, version, values.get("deliverer_id", current[order_id][2]))
+        results.append({"order_id": order_id, "status_code": 200, "status": new_status, "version": version})
+    return results
+
+def migrate_order_version(engine):
+    from sqlalchemy import inspect, text
+
+    columns = [column["name"] for column in inspect(engine).get_columns("orders")]
+    if "version" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    from database.database import engine
+
+    if migrate_order_version(engine):
+        print("Added orders.version")
+    else:
+        print("orders.version already exists")
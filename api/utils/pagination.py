@@ -0,0 +1,53 @@
+import base64
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# With compatibility mode on, requests without limit/cursor still get the
+# old unpaginated response so existing clients keep working.
+PAGINATION_COMPAT_MODE = os.getenv("PAGINATION_COMPAT_MODE", "true").lower() == "true"
+
+def page_size(limit: int | None, cursor: str | None) -> int | None:
+    if limit is None and cursor is None and PAGINATION_COMPAT_MODE:
+        return None
+    return limit or DEFAULT_PAGE_SIZE
+
+def encode_cursor(values: list) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(query, columns: list, limit: int, cursor: str | None, descending: bool = False):
+    # columns must be unique together, e.g. (created_at, id) or (id,).
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        bound = tuple_(*values) if len(values) > 1 else values[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
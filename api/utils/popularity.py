@@ -0,0 +1,86 @@
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+from models.models import FoodItemPopularity, OrderFoodItem
+from utils.derived import insert_for, run_check_cli
+
+POPULAR_THRESHOLD = 10
+
+def is_popular(order_count: int) -> bool:
+    return order_count > POPULAR_THRESHOLD
+
+def get_order_counts(db: Session, food_item_ids: list) -> dict:
+    if not food_item_ids:
+        return {}
+    rows = db.query(FoodItemPopularity.food_item_id, FoodItemPopularity.order_count).filter(
+        FoodItemPopularity.food_item_id.in_(food_item_ids)
+    ).all()
+    return {food_item_id: order_count for food_item_id, order_count in rows}
+
+def increment_order_counts(db: Session, quantities: dict) -> list:
+    # Called inside the order transaction; the caller commits. Returns the
+    # items whose star flag flips with this order.
+    previous = get_order_counts(db, list(quantities))
+    counters = FoodItemPopularity.__table__
+    increments = [
+        {"counter_id": food_item_id, "quantity": quantity}
+        for food_item_id, quantity in quantities.items() if food_item_id in previous
+    ]
+    if increments:
+        # Relative update, so concurrent orders never overwrite each other's counts.
+        db.execute(
+            update(counters)
+            .where(counters.c.food_item_id == bindparam("counter_id"))
+            .values(order_count=counters.c.order_count + bindparam("quantity")),
+            increments,
+        )
+    new_counters = [
+        {"food_item_id": food_item_id, "order_count": quantity}
+        for food_item_id, quantity in quantities.items() if food_item_id not in previous
+    ]
+    if new_counters:
+        # Another order may create the same counter concurrently; add to it
+        # instead of failing this order on the primary key.
+        statement = insert_for(db, counters)
+        statement = statement.on_conflict_do_update(
+            index_elements=[counters.c.food_item_id],
+            set_={"order_count": counters.c.order_count + statement.excluded.order_count},
+        )
+        db.execute(statement, new_counters)
+
+    return [
+        food_item_id for food_item_id, quantity in quantities.items()
+        if not is_popular(previous.get(food_item_id, 0)) and is_popular(previous.get(food_item_id, 0) + quantity)
+    ]
+
+def _actual_order_counts(db: Session) -> dict:
+    rows = db.query(OrderFoodItem.food_item_id, func.sum(OrderFoodItem.quantity)).group_by(OrderFoodItem.food_item_id).all()
+    return {food_item_id: int(total or 0) for food_item_id, total in rows}
+
+def check_popularity(db: Session, repair: bool = False) -> list:
+    actual = _actual_order_counts(db)
+    stored = {row.food_item_id: row for row in db.query(FoodItemPopularity).all()}
+
+    mismatches = []
+    for food_item_id in set(actual) | set(stored):
+        expected = actual.get(food_item_id, 0)
+        row = stored.get(food_item_id)
+        current = row.order_count if row else 0
+        if expected == current:
+            continue
+        mismatches.append({"food_item_id": food_item_id, "stored": current, "actual": expected})
+        if repair:
+            if row:
+                row.order_count = expected
+            else:
+                db.add(FoodItemPopularity(food_item_id=food_item_id, order_count=expected))
+
+    if repair and mismatches:
+        db.commit()
+    return mismatches
+
+def backfill_popularity(db: Session) -> int:
+    return len(check_popularity(db, repair=True))
+
+
+if __name__ == "__main__":
+    run_check_cli("Food item popularity counters", check_popularity, "food_item_id", "Food item", "food item counters")
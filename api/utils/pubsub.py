@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    def __init__(self, topics: frozenset, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.topics = topics
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        # Set when the subscriber fell behind and events were dropped; the
+        # consumer should close so the client reconnects and catches up.
+        self.overflowed = False
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class PubSub:
+    # In-process fan-out from request handlers (any thread) to streaming
+    # responses (event loop). Only reaches subscribers in the same worker.
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, *topics) -> Subscription:
+        # One queue receives the events of every topic.
+        subscription = Subscription(frozenset(topics), asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._add(subscription, subscription.topics)
+        return subscription
+
+    def resubscribe(self, subscription: Subscription, topics):
+        # Changes the topics of a live subscription without losing its queue.
+        topics = frozenset(topics)
+        with self._lock:
+            self._remove(subscription, subscription.topics - topics)
+            self._add(subscription, topics - subscription.topics)
+            subscription.topics = topics
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._remove(subscription, subscription.topics)
+
+    def _add(self, subscription: Subscription, topics):
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+
+    def _remove(self, subscription: Subscription, topics):
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop is closed.
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, topic) -> int:
+        with self._lock:
+            return len(self._subscribers.get(topic, ()))
+
+
+pubsub = PubSub()
@@ -0,0 +1,152 @@
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from utils.cache import TTLCache
+from utils.geo import EARTH_RADIUS_KM
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROUTE_SPEED_KMH = float(os.getenv("ROUTE_SPEED_KMH", 20))
+# An order counts as on time when the deliverer arrives within this many
+# minutes either side of its delivery_time; arriving earlier means waiting.
+ROUTE_TIME_WINDOW_MINUTES = float(os.getenv("ROUTE_TIME_WINDOW_MINUTES", 15))
+ROUTE_MAX_PASSES = int(os.getenv("ROUTE_MAX_PASSES", 20))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", 1000))
+ROUTE_CACHE_TTL_SECONDS = float(os.getenv("ROUTE_CACHE_TTL_SECONDS", 300))
+
+# (deliverer id, order ids and versions) -> route response
+route_cache = TTLCache(maxsize=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL_SECONDS)
+
+def distance_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    # Same formula as calculate_distance, every point against every point.
+    lat_rad = np.radians(lats)
+    lon_rad = np.radians(lons)
+
+    dlat = lat_rad[None, :] - lat_rad[:, None]
+    dlon = lon_rad[None, :] - lon_rad[:, None]
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat_rad)[:, None] * np.cos(lat_rad)[None, :] * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - np.clip(a, 0, 1)))
+    return EARTH_RADIUS_KM * c
+
+
+class RoutePlanner:
+    # Orders the stops of one trip that starts at point 0 of the distance
+    # matrix and does not return. Stops are positions 1..n; due holds each
+    # stop's delivery time in seconds from departure, NaN when there is none.
+
+    def __init__(self, distances: np.ndarray, due: np.ndarray, speed_kmh: float = ROUTE_SPEED_KMH, window_seconds: float = ROUTE_TIME_WINDOW_MINUTES * 60):
+        self.distances = distances
+        self.due = due
+        self.seconds_per_km = 3600 / speed_kmh
+        self.window_seconds = window_seconds
+        # The search loops index single cells, which is much faster on lists.
+        self._rows = distances.tolist()
+        self._due = [None] + [None if np.isnan(value) else value for value in due.tolist()]
+
+    def schedule(self, route: list) -> tuple:
+        # Returns (arrival seconds per stop, lateness in seconds per stop,
+        # total distance).
+        arrivals = []
+        lateness = []
+        clock = distance = 0.0
+        previous = 0
+        for stop in route:
+            leg = self._rows[previous][stop]
+            distance += leg
+            clock += leg * self.seconds_per_km
+            due = self._due[stop]
+            late = 0.0
+            if due is not None:
+                clock = max(clock, due - self.window_seconds)
+                late = max(0.0, clock - due - self.window_seconds)
+            arrivals.append(clock)
+            lateness.append(late)
+            previous = stop
+        return arrivals, lateness, distance
+
+    def nearest_neighbor(self) -> list:
+        route = []
+        unvisited = np.ones(len(self.distances), dtype=bool)
+        unvisited[0] = False
+        current = 0
+        for _ in range(len(self.distances) - 1):
+            candidates = np.flatnonzero(unvisited)
+            current = int(candidates[np.argmin(self.distances[current, candidates])])
+            unvisited[current] = False
+            route.append(current)
+        return route
+
+    @staticmethod
+    def _late_counts(lateness: list) -> list:
+        # counts[k]: late stops among path[1:k + 1]
+        counts = [0]
+        for late in lateness:
+            counts.append(counts[-1] + (late > 0))
+        return counts
+
+    def two_opt(self, route: list) -> list:
+        # Reverses path[i:j + 1] while that lowers total lateness, or keeps it
+        # and lowers distance. A move is priced by its two changed edges
+        # first. Arrivals never get earlier on a longer path, so a move that
+        # does not shorten it can only help by moving a late stop inside the
+        # segment forward; anything else is skipped without replaying.
+        rows = self._rows
+        path = [0] + route
+        _, lateness, _ = self.schedule(route)
+        best_lateness = sum(lateness)
+        for _ in range(ROUTE_MAX_PASSES):
+            improved = False
+            late_counts = self._late_counts(lateness)
+            i = 1
+            while i < len(path) - 1:
+                for j in range(i + 1, len(path)):
+                    a, b, c = path[i - 1], path[i], path[j]
+                    if j + 1 < len(path):
+                        d = path[j + 1]
+                        delta = rows[a][c] + rows[b][d] - rows[a][b] - rows[c][d]
+                    else:
+                        delta = rows[a][c] - rows[a][b]
+                    shorter = delta < -1e-9
+                    if not shorter and late_counts[j] == late_counts[i]:
+                        continue
+                    candidate = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                    _, candidate_lateness, _ = self.schedule(candidate[1:])
+                    total = sum(candidate_lateness)
+                    if total < best_lateness - 1e-9 or (shorter and total <= best_lateness + 1e-9):
+                        path, lateness, best_lateness, improved = candidate, candidate_lateness, total, True
+                        break
+                else:
+                    i += 1
+                    continue
+                # Retry the same i on the changed path.
+                late_counts = self._late_counts(lateness)
+            if not improved:
+                break
+        return path[1:]
+
+    def plan(self) -> list:
+        return self.two_opt(self.nearest_neighbor())
+
+
+def plan_route(start_lat: float, start_lon: float, stops: list, departure: datetime) -> list:
+    # stops are (latitude, longitude, delivery_time or None). Returns one
+    # (stop position, distance from the previous stop, estimated arrival,
+    # late) tuple per stop, in visiting order.
+    if not stops:
+        return []
+    lats = np.array([start_lat] + [stop[0] for stop in stops], dtype=float)
+    lons = np.array([start_lon] + [stop[1] for stop in stops], dtype=float)
+    due = np.array([(stop[2] - departure).total_seconds() if stop[2] else np.nan for stop in stops])
+
+    planner = RoutePlanner(distance_matrix(lats, lons), due)
+    route = planner.plan()
+    arrivals, lateness, _ = planner.schedule(route)
+
+    visits = []
+    previous = 0
+    for stop, arrival, late in zip(route, arrivals, lateness):
+        visits.append((stop - 1, float(planner.distances[previous, stop]), departure + timedelta(seconds=arrival), late > 0))
+        previous = stop
+    return visits
@@ -0,0 +1,161 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from sqlalchemy.orm import Session
+from models.models import FoodItem, FoodType, Restaurant
+
+FOOD_ITEM_FIELD_WEIGHTS = {"name": 3.0, "type": 2.0, "description": 1.0}
+RESTAURANT_FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "city": 1.0}
+PREFIX_MATCH_FACTOR = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Letters NFKD does not decompose into a base letter plus accent.
+_FOLD_TABLE = str.maketrans({"đ": "d", "ł": "l", "ø": "o", "ß": "ss", "æ": "ae"})
+
+def fold(text: str) -> str:
+    text = text.lower().translate(_FOLD_TABLE)
+    text = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+    # Without a Bosnian/Croatian keyboard "đ" is usually typed as "dj".
+    return text.replace("dj", "d")
+
+def tokenize(text: str | None) -> list:
+    return _TOKEN_RE.findall(fold(text)) if text else []
+
+
+class SearchIndex:
+    # Inverted index over active food items and restaurants. It is built from
+    # the database on first use and then kept current by the write endpoints.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        self._postings = {}
+        self._doc_terms = {}
+        self._docs = {}
+        self._terms = []
+
+    def _remove(self, key):
+        for term in self._doc_terms.pop(key, {}):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                self._terms.pop(bisect.bisect_left(self._terms, term))
+        self._docs.pop(key, None)
+
+    def _add(self, key, doc: dict, fields: dict, weights: dict):
+        self._remove(key)
+        terms = {}
+        for field, text in fields.items():
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0.0) + weights[field]
+        for term, weight in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            self._postings[term][key] = weight
+        self._doc_terms[key] = terms
+        self._docs[key] = doc
+
+    def _put_food_item(self, item: FoodItem, type_name: str | None):
+        key = ("food_item", item.id)
+        if not item.is_active:
+            self._remove(key)
+            return
+        doc = {"type": "food_item", "id": item.id, "name": item.name, "restaurant_id": item.restaurant_id, "price": item.price}
+        fields = {"name": item.name, "type": type_name, "description": item.description}
+        self._add(key, doc, fields, FOOD_ITEM_FIELD_WEIGHTS)
+
+    def _put_restaurant(self, restaurant: Restaurant):
+        key = ("restaurant", restaurant.id)
+        if not restaurant.is_active:
+            self._remove(key)
+            return
+        doc = {"type": "restaurant", "id": restaurant.id, "name": restaurant.name, "city": restaurant.city, "category": restaurant.category}
+        fields = {"name": restaurant.name, "category": restaurant.category, "city": restaurant.city}
+        self._add(key, doc, fields, RESTAURANT_FIELD_WEIGHTS)
+
+    def _build(self, db: Session):
+        type_names = dict(db.query(FoodType.id, FoodType.name).all())
+        for restaurant in db.query(Restaurant).filter(Restaurant.is_active == True):
+            self._put_restaurant(restaurant)
+        for item in db.query(FoodItem).filter(FoodItem.is_active == True):
+            self._put_food_item(item, type_names.get(item.type_id))
+        self._built = True
+
+    def index_food_item(self, item: FoodItem, type_name: str | None):
+        with self._lock:
+            if self._built:
+                self._put_food_item(item, type_name)
+
+    def remove_food_item(self, food_item_id: int):
+        with self._lock:
+            self._remove(("food_item", food_item_id))
+
+    def index_food_type(self, db: Session, food_type: FoodType):
+        with self._lock:
+            if self._built:
+                for item in db.query(FoodItem).filter(FoodItem.type_id == food_type.id, FoodItem.is_active == True):
+                    self._put_food_item(item, food_type.name)
+
+    def index_restaurant(self, restaurant: Restaurant):
+        with self._lock:
+            if self._built:
+                self._put_restaurant(restaurant)
+
+    def _matches(self, term: str, prefix: bool) -> dict:
+        scores = dict(self._postings.get(term, {}))
+        if prefix:
+            start = bisect.bisect_left(self._terms, term)
+            for candidate in self._terms[start:]:
+                if not candidate.startswith(term):
+                    break
+                if candidate == term:
+                    continue
+                for key, weight in self._postings[candidate].items():
+                    scores[key] = max(scores.get(key, 0.0), weight * PREFIX_MATCH_FACTOR)
+        return scores
+
+    def search(self, db: Session, query: str, limit: int = 20, doc_type: str | None = None) -> list:
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            if not self._built:
+                self._build(db)
+
+            doc_count = len(self._docs) or 1
+            scores = None
+            for position, term in enumerate(terms):
+                # Autocomplete: the last term is usually still being typed.
+                matches = self._matches(term, prefix=position == len(terms) - 1)
+                idf = math.log(1 + doc_count / (len(matches) or 1))
+                term_scores = {key: weight * idf for key, weight in matches.items()}
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+                if not scores:
+                    return []
+
+            results = []
+            for key, score in scores.items():
+                doc = self._docs[key]
+                if doc_type and doc["type"] != doc_type:
+                    continue
+                if doc["type"] == "food_item":
+                    # Items of archived restaurants stay indexed but are not served.
+                    restaurant = self._docs.get(("restaurant", doc["restaurant_id"]))
+                    if restaurant is None:
+                        continue
+                    doc = {**doc, "restaurant_name": restaurant["name"]}
+                results.append({**doc, "score": round(score, 4)})
+
+        results.sort(key=lambda result: (-result["score"], result["type"], result["id"]))
+        return results[:limit]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,130 @@
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from models.models import ActiveSession
+from utils.cache import TTLCache
+from utils.derived import insert_for
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_STORE = os.getenv("SESSION_STORE", "sql")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 24 * 60 * 60))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", 300))
+# How long a worker trusts its copy of a session row. A logout handled by
+# another worker takes effect here after at most this long.
+SESSION_MIRROR_TTL_SECONDS = float(os.getenv("SESSION_MIRROR_TTL_SECONDS", 5))
+SESSION_MIRROR_SIZE = int(os.getenv("SESSION_MIRROR_SIZE", 100000))
+
+class SessionStore(ABC):
+    # One active login token per username. A session older than ttl seconds
+    # counts as logged out. The db argument is ignored by stores that do not
+    # need it.
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+
+    @abstractmethod
+    def set(self, db: Session, username: str, token: str):
+        ...
+
+    @abstractmethod
+    def remove(self, db: Session, username: str):
+        ...
+
+    @abstractmethod
+    def is_active(self, db: Session, username: str, token: str) -> bool:
+        ...
+
+    @abstractmethod
+    def sweep(self, db: Session | None = None) -> int:
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    # Only for a single worker process: other workers do not see its sessions.
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def set(self, db, username, token):
+        with self._lock:
+            self._sessions[username] = (token, time.monotonic() + self.ttl)
+
+    def remove(self, db, username):
+        with self._lock:
+            self._sessions.pop(username, None)
+
+    def _token(self, username):
+        entry = self._sessions.get(username)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def is_active(self, db, username, token):
+        return self._token(username) == token
+
+    def sweep(self, db=None):
+        now = time.monotonic()
+        with self._lock:
+            expired = [username for username, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for username in expired:
+                del self._sessions[username]
+        return len(expired)
+
+
+class SqlSessionStore(SessionStore):
+    # Sessions live in active_sessions so every worker shares them. Token
+    # checks are answered from a short-lived in-memory copy of each row, so a
+    # login or logout handled by another worker shows up here within
+    # SESSION_MIRROR_TTL_SECONDS.
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, mirror_ttl: float = SESSION_MIRROR_TTL_SECONDS):
+        super().__init__(ttl)
+        self._mirror = TTLCache(maxsize=SESSION_MIRROR_SIZE, ttl=mirror_ttl)
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def set(self, db, username, token):
+        created_at = datetime.utcnow()
+        values = {"username": username, "token": token, "created_at": created_at}
+        statement = insert_for(db, ActiveSession).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ActiveSession.username],
+            set_={"token": statement.excluded.token, "created_at": statement.excluded.created_at},
+        )
+        db.execute(statement)
+        db.commit()
+        self._mirror.set(username, (token, created_at))
+
+    def remove(self, db, username):
+        db.query(ActiveSession).filter(ActiveSession.username == username).delete(synchronize_session=False)
+        db.commit()
+        self._mirror.invalidate(username)
+
+    def is_active(self, db, username, token):
+        entry = self._mirror.get(username)
+        if entry is None or entry[0] != token:
+            # Expired from the mirror, or another worker logged this user in.
+            row = db.query(ActiveSession.token, ActiveSession.created_at).filter(ActiveSession.username == username).first()
+            if row is None:
+                self._mirror.invalidate(username)
+                return False
+            entry = tuple(row)
+            self._mirror.set(username, entry)
+        return entry[0] == token and entry[1] >= self._cutoff()
+
+    def sweep(self, db=None):
+        cutoff = self._cutoff()
+        removed = db.query(ActiveSession).filter(ActiveSession.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return removed
+
+
+session_store = InMemorySessionStore() if SESSION_STORE == "memory" else SqlSessionStore()
@@ -328,9 +328,9 @@ const CustomerShop = () => {
                                     <div key={item.id} className={styles.foodItemCard}>
                                         {item.star && <div className={styles.popularBadge}>★</div>}
                                         <h4 className={styles.foodItemName}>{item.name}</h4>
-                                        {item.image && (
+                                        {item.image_url && (
                                             <img
-                                                src={`data:image/jpeg;base64,${item.image}`}
+                                                src={`http://localhost:8000${item.image_url}`}
                                                 alt={item.name}
                                                 style={{ width: '200px', height: '150px' }}
                                                 className={styles.foodItemImage}
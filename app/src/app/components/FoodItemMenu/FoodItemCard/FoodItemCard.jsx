@@ -42,7 +42,7 @@ const FoodItemCard = ({ foodItem, onFoodItemUpdated, onFoodItemDeleted }) => {
 
   useEffect(() => {
     setEditedFoodItem({ ...foodItem });
-    setImagePreview(`data:image/png;base64,${foodItem.image}`);
+    setImagePreview(foodItem.image_url ? `http://localhost:8000${foodItem.image_url}` : '');
   }, [foodItem]);
 
   useEffect(() => {
@@ -62,8 +62,8 @@ const FoodItemCard = ({ foodItem, onFoodItemUpdated, onFoodItemDeleted }) => {
   const handleSave = () => {
     const foodItemData = { ...editedFoodItem };
 
-    // Provera da li je image null
-    if (!foodItemData.image) {
+    // Slika se šalje samo ako je promijenjena ili uklonjena
+    if (foodItemData.image === '') {
         foodItemData.image = null;
     }
 
@@ -280,9 +280,9 @@ const FoodItemCard = ({ foodItem, onFoodItemUpdated, onFoodItemDeleted }) => {
           <p className={styles.type}>Type: {typeName}</p>
           <p className={styles.restaurant}>Restaurant: {restaurantName}</p>
           <p className={styles.isActive}>Active: {foodItem.is_active ? 'Yes' : 'No'}</p>
-          {foodItem.image && (
+          {foodItem.image_url && (
             <img
-              src={`data:image/png;base64,${foodItem.image}`}
+              src={`http://localhost:8000${foodItem.image_url}`}
               height={100}
               width={100}
               alt={foodItem.name}
@@ -89,7 +89,7 @@ const MenuView = () => {
                         {group.food_items.map(item => (
                             <div key={item.id} className={styles.foodItemCard}>
                                 <h4 className={styles.foodItemName}>{item.name}</h4>
-                                {item.image && <img src={`data:image/jpeg;base64,${item.image}`} alt={item.name} className={styles.foodItemImage} />}
+                                {item.image_url && <img src={`http://localhost:8000${item.image_url}`} alt={item.name} className={styles.foodItemImage} />}
                                 <p className={styles.foodItemDescription}>{item.description}</p>
                                 <p className={styles.foodItemPrice}>Price: ${item.price.toFixed(2)}</p>
                                 {item.discount_price && (
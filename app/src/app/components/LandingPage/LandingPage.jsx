@@ -149,9 +149,9 @@ const LandingPage = () => {
                     <ul>
                       {(selectedRestaurant.food_items || []).map((item) => (
                         <li key={item.id} className={styles.foodItem}>
-                          {item.image && (
+                          {item.image_url && (
                             <img
-                                src={`data:image/jpeg;base64,${item.image}`}
+                                src={`http://localhost:8000${item.image_url}`}
                                 alt={item.name}
                                 style={{ width: '200px', height: '150px' }}
                                 className={styles.foodItemImage}
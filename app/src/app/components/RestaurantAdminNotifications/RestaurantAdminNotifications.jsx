@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import styles from './RestaurantAdminNotifications.module.css';
 import { FaBell } from 'react-icons/fa';
@@ -7,24 +7,60 @@ const RestaurantAdminNotifications = ({ username }) => {
   const [notifications, setNotifications] = useState([]);
   const [unreadCount, setUnreadCount] = useState(0);
   const [isOpen, setIsOpen] = useState(false);
+  // Ids already shown, so replays after a reconnect and events that overlap
+  // the initial fetch are neither listed nor counted twice.
+  const seenIds = useRef(new Set());
 
   useEffect(() => {
+    let eventSource = null;
+    let closed = false;
+
     const fetchNotifications = async () => {
       try {
         const username = localStorage.getItem('username');
         const response = await axios.get(`http://localhost:8000/notifications/${username}`);
+        response.data.notifications.forEach((notif) => seenIds.current.add(notif.id));
         setNotifications(response.data.notifications);
         setUnreadCount(response.data.unread_count);
+        return Math.max(0, ...response.data.notifications.map((notif) => notif.id));
       } catch (error) {
         console.error('Error fetching notifications:', error);
+        return null;
       }
     };
 
-    fetchNotifications();
+    // New orders are pushed by the server; EventSource reconnects on its own
+    // and the server replays anything missed since the last event id. The
+    // stream opens after the fetch and starts from its newest id, so
+    // notifications created in between are delivered once.
+    const openStream = (after) => {
+      const query = after === null ? '' : `?after=${after}`;
+      eventSource = new EventSource(`http://localhost:8000/notifications/${localStorage.getItem('username')}/stream${query}`);
+      eventSource.addEventListener('notification', (event) => {
+        const notification = JSON.parse(event.data);
+        if (seenIds.current.has(notification.id)) {
+          return;
+        }
+        seenIds.current.add(notification.id);
+        setNotifications((prevNotifications) => [notification, ...prevNotifications]);
+        if (!notification.is_read) {
+          setUnreadCount((prevCount) => prevCount + 1);
+        }
+      });
+    };
 
-    const intervalId = setInterval(fetchNotifications, 5000);
+    fetchNotifications().then((after) => {
+      if (!closed) {
+        openStream(after);
+      }
+    });
 
-    return () => clearInterval(intervalId);
+    return () => {
+      closed = true;
+      if (eventSource) {
+        eventSource.close();
+      }
+    };
   }, [username]);
 
   const toggleNotifications = async () => {
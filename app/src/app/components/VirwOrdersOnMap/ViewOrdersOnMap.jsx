@@ -15,6 +15,7 @@ const ViewOrdersOnMap = () => {
   const [orders, setOrders] = useState([]);
   const [deliverers, setDeliverers] = useState([]);
   const [selectedDeliverer, setSelectedDeliverer] = useState("");
+  const [delivererLocations, setDelivererLocations] = useState({});
   const router = useRouter();
   const [loading, setLoading] = useState(true);
   const [isAuthorized, setIsAuthorized] = useState(false);
@@ -80,6 +81,20 @@ const ViewOrdersOnMap = () => {
     fetchOrders();
   }, []);
 
+  useEffect(() => {
+    if (!isAuthorized) {
+      return;
+    }
+    // Live positions of the deliverers carrying this restaurant's orders.
+    const eventSource = new EventSource(`http://localhost:8000/map/deliverers/${localStorage.getItem('username')}/stream?access_token=${localStorage.getItem('token')}`);
+    eventSource.addEventListener('location', (event) => {
+      const location = JSON.parse(event.data);
+      setDelivererLocations((prevLocations) => ({ ...prevLocations, [location.deliverer_id]: location }));
+    });
+
+    return () => eventSource.close();
+  }, [isAuthorized]);
+
   const groupedOrders = orders.reduce((acc, order) => {
     const key = `${order.customer_latitude}-${order.customer_longitude}`;
     if (!acc[key]) {
@@ -137,6 +152,7 @@ const ViewOrdersOnMap = () => {
         <p><span style={{ color: 'green' }}>●</span> Delivered</p>
         <p><span style={{ color: 'purple' }}>●</span> Approved</p>
         <p><span style={{ color: 'red' }}>●</span> More Orders</p>
+        <p><span style={{ color: 'black' }}>●</span> Deliverer</p>
       </div>
       <div className={styles.datePickerContainer}>
         <DatePicker
@@ -212,6 +228,20 @@ const ViewOrdersOnMap = () => {
             </Marker>
           );
         })}
+        {Object.values(delivererLocations).map(location => (
+          <Marker
+            key={`deliverer-${location.deliverer_id}`}
+            position={[location.latitude, location.longitude]}
+            icon={createIcon('black')}
+          >
+            <Popup>
+              <div className={styles.popupContent}>
+                <b>Deliverer:</b> {deliverers.find(deliverer => deliverer.id === location.deliverer_id)?.username || location.deliverer_id} <br />
+                <b>Last update:</b> {new Date(`${location.recorded_at}Z`).toLocaleTimeString()} <br />
+              </div>
+            </Popup>
+          </Marker>
+        ))}
       </MapContainer>
     </div>
   );